@@ -0,0 +1,166 @@
+# Read-only access to an Anki collection file (collection.anki2) without Anki or AnkiConnect
+# Opens the database read-only (optionally copying it into memory first), translates a subset of the
+# Anki search syntax to SQL, and streams card rows with note fields split on the \x1f separator.
+# Supported search terms: tag:, deck:, note:, Field:value (with * and _ wildcards), "-" negation and
+# quoting. Anything else raises ValueError; use AnkiConnect for those queries.
+
+import json
+import pathlib
+import re
+import shlex
+import sqlite3
+
+COLLECTION_PATH = r'C:\Users\Beangate\AppData\Roaming\Anki2\User 1\collection.anki2'
+FETCH_SIZE = 10000  # Rows per fetchmany() while streaming cards
+FIELD_SEPARATOR = "\x1f"
+
+
+def open_collection(path=COLLECTION_PATH, snapshot=False):
+    """
+    Opens the collection read-only. With snapshot=True the file is copied into an in-memory database
+    with the SQLite backup API first, so Anki can keep writing while we read.
+    """
+    conn = sqlite3.connect(pathlib.Path(path).resolve().as_uri() + "?mode=ro", uri=True, timeout=5)
+    if snapshot:
+        memory = sqlite3.connect(":memory:")
+        try:
+            conn.backup(memory)
+        finally:
+            conn.close()
+        conn = memory
+    return conn
+
+
+def _glob_regex(pattern):
+    """Anki wildcards: * matches anything, _ matches one character. Case-insensitive, whole value."""
+    parts = (".*" if c == "*" else "." if c == "_" else re.escape(c) for c in pattern)
+    return re.compile("".join(parts), re.IGNORECASE | re.DOTALL)
+
+
+def _like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("*", "%")
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+class Collection:
+    """
+    Notetype, field and deck lookups for an open collection, read from the notetypes/fields/decks
+    tables of current collections or from the col.models/col.decks JSON of legacy ones.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._notetypes = None
+        self._decks = None
+
+    def notetypes(self):
+        """Returns {notetype id: (name, [field names in ord order])}."""
+        if self._notetypes is None:
+            if _has_table(self.conn, "fields"):
+                names = dict(self.conn.execute("SELECT id, name FROM notetypes"))
+                fields = {ntid: [] for ntid in names}
+                for ntid, _, name in self.conn.execute("SELECT ntid, ord, name FROM fields ORDER BY ntid, ord"):
+                    fields.setdefault(ntid, []).append(name)
+                self._notetypes = {ntid: (names.get(ntid, ""), fields[ntid]) for ntid in fields}
+            else:
+                models = json.loads(self.conn.execute("SELECT models FROM col").fetchone()[0])
+                self._notetypes = {
+                    int(mid): (m["name"], [f["name"] for f in sorted(m["flds"], key=lambda f: f["ord"])])
+                    for mid, m in models.items()}
+        return self._notetypes
+
+    def decks(self):
+        """Returns {deck id: full deck name with "::" separators}."""
+        if self._decks is None:
+            if _has_table(self.conn, "decks"):
+                self._decks = {did: name.replace(FIELD_SEPARATOR, "::")
+                               for did, name in self.conn.execute("SELECT id, name FROM decks")}
+            else:
+                decks = json.loads(self.conn.execute("SELECT decks FROM col").fetchone()[0])
+                self._decks = {int(did): d["name"] for did, d in decks.items()}
+        return self._decks
+
+    def field_ords(self, field_name):
+        """Returns {notetype id: ord} for every notetype that has a field called field_name."""
+        wanted = field_name.lower()
+        return {ntid: [f.lower() for f in fields].index(wanted)
+                for ntid, (_, fields) in self.notetypes().items() if wanted in (f.lower() for f in fields)}
+
+    def _deck_ids(self, pattern):
+        regex = _glob_regex(pattern)
+        matched = [name for name in self.decks().values() if regex.fullmatch(name)]
+        # deck:X includes X's subdecks
+        return [did for did, name in self.decks().items()
+                if any(name == m or name.startswith(m + "::") for m in matched)]
+
+    def _notetype_ids(self, pattern):
+        regex = _glob_regex(pattern)
+        return [ntid for ntid, (name, _) in self.notetypes().items() if regex.fullmatch(name)]
+
+    def translate(self, query):
+        """
+        Translates query into (SQL condition on cards c / notes n, params, field filters), where each
+        field filter is (ords by notetype id, value regex, negated) and is checked on the split fields.
+        """
+        conditions, params, field_filters = [], [], []
+        for term in shlex.split(query):
+            negated = term.startswith("-") and len(term) > 1
+            if negated:
+                term = term[1:]
+            key, sep, value = term.partition(":")
+            if not sep or not key:
+                raise ValueError(f"Unsupported search term for the offline backend: {term!r}")
+            key_lower = key.lower()
+
+            if key_lower == "tag":
+                tag = _like_escape(value)
+                condition = "(n.tags LIKE ? ESCAPE '\\' OR n.tags LIKE ? ESCAPE '\\')"
+                params += [f"% {tag} %", f"% {tag}::%"]
+            elif key_lower == "deck":
+                ids = self._deck_ids(value)
+                placeholders = ",".join(str(int(did)) for did in ids) or "-1"
+                condition = f"(c.did IN ({placeholders}) OR c.odid IN ({placeholders}))"
+            elif key_lower == "note":
+                ids = self._notetype_ids(value)
+                condition = f"n.mid IN ({','.join(str(int(ntid)) for ntid in ids) or '-1'})"
+            elif key_lower in ("is", "prop", "added", "rated", "edited", "card", "flag", "nid", "cid", "re"):
+                raise ValueError(f"Unsupported search term for the offline backend: {term!r}")
+            else:
+                ords = self.field_ords(key)
+                field_filters.append((ords, _glob_regex(value), negated))
+                if negated:
+                    continue  # Notes without the field match a negated field search, so filter in Python only
+                condition = f"n.mid IN ({','.join(str(int(ntid)) for ntid in ords) or '-1'})"
+            conditions.append(f"NOT {condition}" if negated else condition)
+        return " AND ".join(conditions) or "1", params, field_filters
+
+    def iter_cards(self, query, field_names):
+        """
+        Streams (card id, note id, deck id, notetype id, tags, values) for every card matching query,
+        where values holds the raw contents of field_names (None if the notetype has no such field).
+        Rows are fetched FETCH_SIZE at a time.
+        """
+        where, params, field_filters = self.translate(query)
+        ords = [self.field_ords(name) for name in field_names]
+        cursor = self.conn.cursor()
+        cursor.arraysize = FETCH_SIZE
+        cursor.execute(f"""
+            SELECT c.id, n.id, c.did, n.mid, n.tags, n.flds
+            FROM cards c JOIN notes n ON n.id = c.nid
+            WHERE {where}
+        """, params)
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for cid, nid, did, mid, tags, flds in rows:
+                fields = flds.split(FIELD_SEPARATOR)
+                if field_filters and not all(
+                        (mid in f_ords and regex.fullmatch(fields[f_ords[mid]]) is not None) != negated
+                        for f_ords, regex, negated in field_filters):
+                    continue
+                values = tuple(fields[o[mid]] if mid in o else None for o in ords)
+                yield cid, nid, did, mid, tags, values
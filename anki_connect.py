@@ -0,0 +1,209 @@
+# Shared AnkiConnect client used by the Anki scripts in this repo
+# Requires: Anki running with AnkiConnect add-on
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ANKICONNECT_URL = "http://localhost:8765"
+CHUNK_SIZE = 500  # Card/note ids per request when fetching info in chunks
+MAX_WORKERS = 4   # Concurrent requests in flight; Anki handles requests one at a time, keep this small
+
+
+class AnkiConnectError(Exception):
+    """Raised when AnkiConnect returns an error for an action."""
+
+
+def chunked(ids, size):
+    """Splits a list into consecutive chunks of at most size items."""
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+class AnkiConnect:
+    """
+    AnkiConnect client with a pooled requests.Session, so every call reuses the same connections.
+    """
+
+    def __init__(self, url=ANKICONNECT_URL, chunk_size=CHUNK_SIZE, max_workers=MAX_WORKERS):
+        self.url = url
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.bytes_received = 0
+        self._bytes_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def invoke(self, action, **params):
+        """Calls one AnkiConnect action and returns its result."""
+        resp = self.session.post(self.url, json={
+            "action": action,
+            "version": 6,
+            "params": params
+        })
+        resp.raise_for_status()
+        with self._bytes_lock:
+            self.bytes_received += len(resp.content)
+        body = resp.json()
+        if body.get("error"):
+            raise AnkiConnectError(f"{action}: {body['error']}")
+        return body.get("result")
+
+    def batch(self):
+        """Returns an AnkiBatch that sends its queued actions to this client as one "multi" request."""
+        return AnkiBatch(self)
+
+    def iter_chunked(self, action, key, ids):
+        """
+        Calls action once per chunk of ids (passed as the params[key] list), with up to max_workers
+        chunks in flight. Yields the individual result items as each chunk finishes.
+        """
+        chunks = chunked(list(ids), self.chunk_size)
+        if not chunks:
+            return
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = [pool.submit(self.invoke, action, **{key: chunk}) for chunk in chunks]
+            for future in as_completed(futures):
+                yield from future.result() or []
+        finally:
+            # Don't wait for chunks nobody will read if the caller stops early
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def run_actions(self, actions, batch_size=None):
+        """
+        Sends (action, params) pairs as "multi" requests of at most batch_size (default chunk_size)
+        actions each and returns the list of results. For independent writes like updateNoteFields.
+        """
+        results = []
+        for group in chunked(list(actions), batch_size or self.chunk_size):
+            batch = self.batch()
+            for i, (action, params) in enumerate(group):
+                batch.add(action, key=str(i), **params)
+            results.extend(batch.send().values())
+        return results
+
+    def add_tags(self, notes_by_tag):
+        """
+        Adds tags to notes given as {tag: [note ids]}. Each tag costs one addTags action per
+        chunk_size notes, and all of them go out together in as few "multi" requests as possible.
+        Returns the number of round trips.
+        """
+        actions = [("addTags", {"notes": chunk, "tags": tag})
+                   for tag, note_ids in notes_by_tag.items()
+                   for chunk in chunked(list(note_ids), self.chunk_size)]
+        self.run_actions(actions)
+        return len(chunked(actions, self.chunk_size))
+
+    def update_note_fields(self, fields_by_note):
+        """
+        Sets fields on many notes given as {note id: {field name: value}}, one updateNoteFields action
+        per note, sent chunk_size actions per "multi" request. Returns the number of round trips.
+        """
+        actions = [("updateNoteFields", {"note": {"id": note_id, "fields": fields}})
+                   for note_id, fields in fields_by_note.items()]
+        self.run_actions(actions)
+        return len(chunked(actions, self.chunk_size))
+
+    def iter_cards_info(self, card_ids):
+        """Streams cardsInfo results for card_ids, chunk by chunk, in completion order."""
+        return self.iter_chunked("cardsInfo", "cards", card_ids)
+
+    def fetch_note_fields(self, query, fields):
+        """
+        Fetches the notes matching query with findNotes/notesInfo instead of cardsInfo, so a note
+        with several cards comes back once. Only the requested fields are kept as each chunk is parsed.
+        Returns a list of {"noteId", "modelName", "tags", "fields": {name: {"value": ...}}} in findNotes
+        order (deterministic, whatever order the chunks finish in) and prints how many duplicate cards
+        and bytes were saved.
+        """
+        batch = self.batch()
+        batch.add("findNotes", key="notes", query=query)
+        batch.add("findCards", key="cards", query=query)
+        found = batch.send()
+        note_ids, card_count = found["notes"], len(found["cards"])
+
+        wanted = set(fields)
+        by_id = {}
+        received_before = self.bytes_received
+        kept_bytes = 0
+        for note in self.iter_chunked("notesInfo", "notes", note_ids):
+            if not note or note["noteId"] in by_id:
+                continue
+            projected = {
+                "noteId": note["noteId"],
+                "modelName": note["modelName"],
+                "tags": note["tags"],
+                "fields": {name: {"value": f["value"]} for name, f in note["fields"].items() if name in wanted},
+            }
+            kept_bytes += len(json.dumps(projected, ensure_ascii=False).encode("utf-8"))
+            by_id[note["noteId"]] = projected
+        notes = [by_id[nid] for nid in note_ids if nid in by_id]
+
+        received = self.bytes_received - received_before
+        duplicates = max(0, card_count - len(notes))
+        # cardsInfo repeats the full note for every card, so it would have sent at least this much
+        cards_info_estimate = received * card_count // len(notes) if notes else 0
+        print(f"Fetched {len(notes)} notes for {card_count} cards: skipped {duplicates} duplicate cards, "
+              f"kept {kept_bytes:,} of {received:,} bytes received "
+              f"(cardsInfo would send at least {cards_info_estimate:,} bytes).")
+        return notes
+
+
+class AnkiBatch:
+    """
+    Queues several independent AnkiConnect actions and sends them in a single "multi" request.
+    Only batch actions whose params do not depend on each other's results: AnkiConnect runs them
+    in order but cannot feed one result into the next action.
+
+        batch = anki.batch()
+        batch.add("findCards", query="deck:Default")
+        batch.add("findNotes", key="notes", query="deck:Default")
+        results = batch.send()  # {"findCards": [...], "notes": [...]}
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.keys = []
+        self.actions = []
+
+    def __len__(self):
+        return len(self.actions)
+
+    def add(self, action, key=None, **params):
+        """Queues an action; its result is returned under key (defaults to the action name)."""
+        key = key or action
+        if key in self.keys:
+            raise ValueError(f"Duplicate batch key: {key}")
+        self.keys.append(key)
+        self.actions.append({"action": action, "version": 6, "params": params})
+        return key
+
+    def send(self):
+        """Sends all queued actions in one round trip and returns {key: result}."""
+        if not self.actions:
+            return {}
+        replies = self.client.invoke("multi", actions=self.actions)
+        results = {}
+        for key, action, reply in zip(self.keys, self.actions, replies):
+            # Each reply is {"result": ..., "error": ...} for versioned actions
+            if isinstance(reply, dict) and set(reply) == {"result", "error"}:
+                if reply["error"]:
+                    raise AnkiConnectError(f"{action['action']}: {reply['error']}")
+                reply = reply["result"]
+            results[key] = reply
+        self.keys, self.actions = [], []
+        return results
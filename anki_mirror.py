@@ -0,0 +1,146 @@
+# Incremental local mirror of Anki notes in SQLite
+# Keeps note ids, mod times, fields and tags on disk and only asks AnkiConnect for notes edited since
+# the last sync, so repeat runs of the Anki scripts don't download every note again.
+
+import json
+import math
+import sqlite3
+import time
+
+import requests
+
+from anki_connect import AnkiConnect, AnkiConnectError, ANKICONNECT_URL
+
+MIRROR_PATH = "anki_mirror.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    model TEXT NOT NULL,
+    mod INTEGER NOT NULL,
+    tags TEXT NOT NULL,     -- JSON list
+    fields TEXT NOT NULL,   -- JSON {field name: value}
+    cards TEXT NOT NULL     -- JSON list of card ids
+);
+CREATE TABLE IF NOT EXISTS query_notes (
+    query TEXT NOT NULL,
+    note_id INTEGER NOT NULL,
+    PRIMARY KEY (query, note_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync_state (
+    query TEXT PRIMARY KEY,
+    last_sync REAL NOT NULL
+);
+"""
+
+
+class AnkiMirror:
+    """
+    SQLite mirror of the notes matching one or more Anki search queries.
+    sync(query) refreshes the mirror incrementally; notes(query) reads from it without touching Anki.
+    """
+
+    def __init__(self, path=MIRROR_PATH, client=None):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self.client = client or AnkiConnect(ANKICONNECT_URL)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _stored_mods(self, note_ids):
+        mods = {}
+        cursor = self.conn.cursor()
+        for i in range(0, len(note_ids), 900):
+            chunk = note_ids[i:i + 900]
+            cursor.execute(f"SELECT id, mod FROM notes WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            mods.update(cursor.fetchall())
+        return mods
+
+    def sync(self, query):
+        """
+        Brings the mirror up to date for query and returns the number of notes fetched.
+        Only notes that are new to the mirror or were edited since the last sync are downloaded.
+        """
+        start = time.perf_counter()
+        row = self.conn.execute("SELECT last_sync FROM sync_state WHERE query = ?", (query,)).fetchone()
+        sync_time = time.time()
+
+        # Current membership and recently edited notes in one round trip
+        batch = self.client.batch()
+        batch.add("findNotes", key="all", query=query)
+        if row:
+            days = math.ceil((sync_time - row[0]) / 86400) + 1
+            batch.add("findNotes", key="edited", query=f"({query}) edited:{days}")
+        found = batch.send()
+        note_ids = found["all"]
+        stored = self._stored_mods(note_ids)
+        candidates = [nid for nid in found.get("edited", []) if nid in stored]
+
+        # edited:N works in whole days, so confirm with the actual mod times where AnkiConnect supports it
+        if candidates:
+            try:
+                mod_times = self.client.invoke("notesModTime", notes=candidates)
+                candidates = [m["noteId"] for m in mod_times if stored.get(m["noteId"]) != m["mod"]]
+            except AnkiConnectError:
+                pass  # Older AnkiConnect: refetch everything edited in the window
+        changed = [nid for nid in note_ids if nid not in stored] + candidates
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO notes (id, model, mod, tags, fields, cards) VALUES (?, ?, ?, ?, ?, ?)",
+                ((note["noteId"], note["modelName"], note.get("mod", 0),
+                  json.dumps(note["tags"], ensure_ascii=False),
+                  json.dumps({name: f["value"] for name, f in note["fields"].items()}, ensure_ascii=False),
+                  json.dumps(note.get("cards", [])))
+                 for note in self.client.iter_chunked("notesInfo", "notes", changed) if note))
+            self.conn.execute("DELETE FROM query_notes WHERE query = ?", (query,))
+            self.conn.executemany("INSERT INTO query_notes (query, note_id) VALUES (?, ?)",
+                                  ((query, nid) for nid in note_ids))
+            self.conn.execute("INSERT OR REPLACE INTO sync_state (query, last_sync) VALUES (?, ?)",
+                              (query, sync_time))
+            # Drop notes no synced query refers to anymore
+            self.conn.execute("DELETE FROM notes WHERE id NOT IN (SELECT note_id FROM query_notes)")
+
+        print(f"Mirror sync for '{query}': {len(note_ids)} notes, {len(changed)} fetched "
+              f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return len(changed)
+
+    def notes(self, query):
+        """
+        Returns the mirrored notes for query in the same shape as AnkiConnect's notesInfo
+        (noteId, modelName, mod, tags, fields: {name: {"value": ...}}, cards).
+        """
+        rows = self.conn.execute("""
+            SELECT n.id, n.model, n.mod, n.tags, n.fields, n.cards
+            FROM query_notes q JOIN notes n ON n.id = q.note_id
+            WHERE q.query = ?
+            ORDER BY n.id
+        """, (query,))
+        return [{
+            "noteId": nid,
+            "modelName": model,
+            "mod": mod,
+            "tags": json.loads(tags),
+            "fields": {name: {"value": value} for name, value in json.loads(fields).items()},
+            "cards": json.loads(cards),
+        } for nid, model, mod, tags, fields, cards in rows]
+
+
+def get_mirrored_notes(query, path=MIRROR_PATH, url=ANKICONNECT_URL):
+    """
+    Syncs the mirror for query (if Anki is reachable) and returns its notes.
+    If AnkiConnect can't be reached, the last synced state is returned instead.
+    """
+    with AnkiMirror(path, AnkiConnect(url)) as mirror:
+        try:
+            mirror.sync(query)
+        except requests.ConnectionError:
+            print("AnkiConnect not reachable, using the last synced mirror.")
+        return mirror.notes(query)
@@ -0,0 +1,117 @@
+# Benchmark for anki_connect.py against a local stand-in AnkiConnect server with injected latency.
+# Does not need Anki running: the stand-in serves synthetic cards and notes on STAND_IN_PORT.
+
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from anki_connect import AnkiConnect
+
+# --- USER CONFIGURATION ---
+STAND_IN_PORT = 8766
+LATENCY_MS = 30      # Injected per-request latency of the stand-in server
+CARD_COUNT = 20000   # Cards returned by findCards
+NOTE_FIELD_CHARS = 80
+# -------------------------
+
+
+def _card(card_id):
+    return {
+        "cardId": card_id,
+        "note": 1_000_000 + card_id // 2,
+        "deckName": "Sentence Mining",
+        "modelName": "Mining",
+        "fields": {"Sentence": {"value": "文" * NOTE_FIELD_CHARS, "order": 0}},
+    }
+
+
+def _note(note_id):
+    return {
+        "noteId": note_id,
+        "modelName": "Mining",
+        "tags": ["bench"],
+        "fields": {"Sentence": {"value": "文" * NOTE_FIELD_CHARS, "order": 0}},
+    }
+
+
+STAND_IN_ACTIONS = {
+    "findCards": lambda params: list(range(CARD_COUNT)),
+    "findNotes": lambda params: sorted({1_000_000 + i // 2 for i in range(CARD_COUNT)}),
+    "cardsInfo": lambda params: [_card(i) for i in params["cards"]],
+    "notesInfo": lambda params: [_note(i) for i in params["notes"]],
+    "getDeckStats": lambda params: {"1": {"name": d, "new_count": 0} for d in params["decks"]},
+    "deckNames": lambda params: ["Sentence Mining"],
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers AnkiConnect version 6 requests, sleeping LATENCY_MS per HTTP request."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(LATENCY_MS / 1000)
+        if request["action"] == "multi":
+            result = [{"result": STAND_IN_ACTIONS[a["action"]](a.get("params", {})), "error": None}
+                      for a in request["params"]["actions"]]
+        else:
+            result = STAND_IN_ACTIONS[request["action"]](request.get("params", {}))
+        body = json.dumps({"result": result, "error": None}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def timed(label, fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<45} {best * 1000:8.1f} ms")
+    return best
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", STAND_IN_PORT), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    anki = AnkiConnect(f"http://127.0.0.1:{STAND_IN_PORT}")
+    query = "deck:\"Sentence Mining\""
+
+    print(f"Stand-in AnkiConnect with {LATENCY_MS} ms latency, {CARD_COUNT} cards\n")
+
+    def sequential():
+        anki.invoke("findCards", query=query)
+        anki.invoke("findNotes", query=query)
+        anki.invoke("deckNames")
+        anki.invoke("getDeckStats", decks=["Sentence Mining"])
+
+    def batched():
+        batch = anki.batch()
+        batch.add("findCards", query=query)
+        batch.add("findNotes", query=query)
+        batch.add("deckNames")
+        batch.add("getDeckStats", decks=["Sentence Mining"])
+        batch.send()
+
+    seq = timed("4 independent actions, sequential", sequential)
+    multi = timed("4 independent actions, one multi", batched)
+    print(f"{'':<45} {seq / multi:8.1f}x\n")
+
+    card_ids = anki.invoke("findCards", query=query)
+    single = timed("cardsInfo, one request for all ids", lambda: anki.invoke("cardsInfo", cards=card_ids))
+    chunked = timed("cardsInfo, chunked + concurrent", lambda: sum(1 for _ in anki.iter_cards_info(card_ids)))
+    print(f"{'':<45} {single / chunked:8.1f}x")
+    timed("cardsInfo, chunked: time to first card", lambda: next(iter(anki.iter_cards_info(card_ids))))
+
+    anki.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,13 @@ import sqlite3
 import random
 import time
 import datetime
+import itertools
+import json
+import math
 import os
+import pathlib
+
+from review_simulator import simulate_reviews
 
 # --- Configuration ---
 # IMPORTANT: Replace with the actual path to your Anki collection.anki2 file
@@ -22,14 +28,143 @@ REVIEW_TIME_MS = 5000 # Simulated time taken to review in milliseconds (e.g., 5
 SIMULATED_INTERVAL = 1 # Placeholder interval (e.g., 1 day)
 SIMULATED_LAST_INTERVAL = 0 # Placeholder last interval
 SIMULATED_FACTOR = 2500 # Placeholder ease factor (2500 = 250%)
+# With SIMULATE_SCHEDULING = True, ivl/lastIvl/factor are derived from each card's existing review history
+# by replaying it through an SM-2 or FSRS scheduler (see review_simulator.py) instead of the placeholders above.
+SIMULATE_SCHEDULING = True
+SIMULATION_MODEL = "fsrs"  # "fsrs" or "sm2"; SM-2 always provides the factor
 DRY_RUN = False # Set to True to only print the SQL without executing it
 CARD_ID = 1747433461669 # Only if you want to target a specific card, otherwise set to None
 # DATE_OVERRIDE = "2025-04-21" # Set to a specific date string 'YYYY-MM-DD' if needed, otherwise None
 DATE_OVERRIDE = None
 DECK_NAME = "Sentence Mining"  # Deck to search for suspended cards
 
+# --- Backfill Mode ---
+# Set both dates ('YYYY-MM-DD', inclusive) to fill every day in the range in a single run
+# instead of adding one review for yesterday/DATE_OVERRIDE.
+BACKFILL_START_DATE = None
+BACKFILL_END_DATE = None
+REVIEWS_PER_DAY = 10  # Number of review log entries to add for each day in the range
+BACKFILL_FIRST_HOUR = 9  # Backfilled reviews are spread evenly between these local hours
+BACKFILL_LAST_HOUR = 21
+
+# --- Gap Detection Mode ---
+# Set FIND_GAPS = True to list every day without reviews between GAP_START_DATE and GAP_END_DATE
+# ('YYYY-MM-DD', inclusive; GAP_END_DATE = None means yesterday). Days follow the collection's
+# rollover hour. With FILL_GAPS = True those days are backfilled with REVIEWS_PER_DAY reviews each.
+FIND_GAPS = False
+GAP_START_DATE = "2025-01-01"
+GAP_END_DATE = None
+FILL_GAPS = False
+
+# --- Locking ---
+# With USE_SNAPSHOT = True, card selection and planning run against an in-memory snapshot taken with
+# the SQLite backup API, and the live collection is only opened for one short write transaction
+# after you confirm. This keeps the lock time on collection.anki2 minimal while Anki is running.
+USE_SNAPSHOT = True
+BUSY_TIMEOUT_MS = 5000  # How long to wait for Anki to release its lock before giving up
+
 # --- Don't modify below this line unless you know what you're doing ---
 
+# revlog schema: id, cid, usn, ease, ivl, lastIvl, factor, time, type
+REVLOG_INSERT_SQL = """
+    INSERT INTO revlog (id, cid, usn, ease, ivl, lastIvl, factor, time, type)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# queue = -1 means suspended
+SUSPENDED_CARDS_SQL = """
+    SELECT id FROM cards
+    WHERE queue = -1 AND did IN (SELECT id FROM decks WHERE name = ? COLLATE BINARY)
+"""
+
+
+def take_snapshot(db_path):
+    """
+    Copies the collection into an in-memory database with the SQLite backup API.
+    The live file is opened read-only and only for the duration of the copy.
+    """
+    start = time.perf_counter()
+    live = sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + "?mode=ro", uri=True,
+                           timeout=BUSY_TIMEOUT_MS / 1000)
+    snapshot = sqlite3.connect(":memory:")
+    try:
+        live.backup(snapshot)
+    finally:
+        live.close()
+    print(f"Took a snapshot of the collection in {(time.perf_counter() - start) * 1000:.1f} ms.")
+    return snapshot
+
+
+def open_for_planning(db_path):
+    """Returns the connection used for selection and planning: a snapshot, or the live file."""
+    if USE_SNAPSHOT:
+        return take_snapshot(db_path)
+    return sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+
+
+def apply_revlog_rows(db_path, rows):
+    """
+    Inserts the planned revlog rows into the live collection in one short write transaction.
+    Returns how long the write lock was held, in milliseconds.
+    """
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    try:
+        conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT_MS)}")
+        conn.execute("BEGIN IMMEDIATE")
+        lock_start = time.perf_counter()
+        try:
+            conn.executemany(REVLOG_INSERT_SQL, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return (time.perf_counter() - lock_start) * 1000
+    finally:
+        conn.close()
+
+
+def simulate_scheduling(cursor, rows):
+    """Replaces the placeholder ivl/lastIvl/factor of planned revlog rows with simulated values."""
+    if not SIMULATE_SCHEDULING or not rows:
+        return rows
+    ivl, last_ivl, factor = simulate_reviews(cursor, [row[1] for row in rows], [row[0] for row in rows],
+                                             [row[3] for row in rows], SIMULATION_MODEL)
+    return [row[:4] + (int(i), int(li), int(f)) + row[7:]
+            for row, i, li, f in zip(rows, ivl, last_ivl, factor)]
+
+
+def _random_open_unit():
+    """Returns a random float in the open interval (0, 1)."""
+    u = random.random()
+    while u == 0.0:
+        u = random.random()
+    return u
+
+
+def sample_suspended_cards(cursor, deck_name, n):
+    """
+    Picks up to n distinct random suspended card IDs from the deck without loading every ID.
+    Uses reservoir sampling (Algorithm L) over a streaming cursor, so only the n sampled IDs
+    are kept in memory and most rows are skipped inside the cursor iteration.
+    """
+    if n < 1:
+        return []
+    cursor.execute(SUSPENDED_CARDS_SQL, (deck_name,))
+    rows = iter(cursor)
+    reservoir = [row[0] for row in itertools.islice(rows, n)]
+    if len(reservoir) == n:
+        w = math.exp(math.log(_random_open_unit()) / n)
+        while True:
+            skip = int(math.log(_random_open_unit()) / math.log(1.0 - w))
+            row = next(itertools.islice(rows, skip, None), None)
+            if row is None:
+                break
+            reservoir[random.randrange(n)] = row[0]
+            w *= math.exp(math.log(_random_open_unit()) / n)
+    random.shuffle(reservoir)
+    return reservoir
+
+
 def add_review_to_random_suspended_card(db_path):
     """
     Connects to the Anki DB, finds a random suspended card, and adds a review log entry for yesterday.
@@ -40,26 +175,19 @@ def add_review_to_random_suspended_card(db_path):
 
     conn = None
     try:
-        conn = sqlite3.connect(db_path)
+        conn = open_for_planning(db_path)
         cursor = conn.cursor()
 
         if CARD_ID:
             random_card_id = CARD_ID
             print(f"Using specified card ID: {random_card_id}")
         else:
-            # Find all suspended card IDs in the specified deck
-            # queue = -1 means suspended
-            cursor.execute(f"SELECT id FROM cards WHERE queue = -1 AND did IN (SELECT id FROM decks WHERE name = '{DECK_NAME}' COLLATE BINARY)")
-            suspended_card_ids = [row[0] for row in cursor.fetchall()]
-
-            print(suspended_card_ids)
-
-            if not suspended_card_ids:
+            # Select a random suspended card ID in the specified deck
+            sampled = sample_suspended_cards(cursor, DECK_NAME, 1)
+            if not sampled:
                 print("No suspended cards found.")
                 return
-
-            # Select a random suspended card ID
-            random_card_id = random.choice(suspended_card_ids)
+            random_card_id = sampled[0]
             print(f"Selected random suspended card ID: {random_card_id}")
 
         if DATE_OVERRIDE:
@@ -78,16 +206,23 @@ def add_review_to_random_suspended_card(db_path):
             # revlog.id is actually milliseconds since epoch
             yesterday_timestamp_ms = int(yesterday.timestamp() * 1000)
 
-        # Get current max revlog id to ensure uniqueness (though timestamp should be unique enough)
-        # Anki's revlog.id is the timestamp, which should be unique for each review.
-        # Using the calculated timestamp for yesterday is the correct approach for revlog.id.
-        revlog_id = yesterday_timestamp_ms
+        # Anki's revlog.id is the timestamp, which must be unique for each review.
+        # Use the calculated timestamp for yesterday, moved to the next free millisecond if it is taken.
+        revlog_id = allocate_revlog_ids(cursor, [yesterday_timestamp_ms])[0]
 
         # Get a unique update sequence number (usn)
         # Anki uses usn to track changes for syncing.
         # -1 is typically used for manual changes outside of normal sync operations.
         usn = -1
 
+        row = (revlog_id, random_card_id, usn, REVIEW_EASE, SIMULATED_INTERVAL,
+               SIMULATED_LAST_INTERVAL, SIMULATED_FACTOR, REVIEW_TIME_MS, REVIEW_TYPE)
+        row = simulate_scheduling(cursor, [row])[0]
+
+        # Planning is done; release the collection before waiting on the prompt
+        conn.close()
+        conn = None
+
         # Insert a new entry into the revlog table
         # revlog schema: id, cid, usn, ease, ivl, lastIvl, factor, time, type
         # id: milliseconds since epoch
@@ -102,18 +237,13 @@ def add_review_to_random_suspended_card(db_path):
         if DRY_RUN:
             print(f"""
                 INSERT INTO revlog (id, cid, usn, ease, ivl, lastIvl, factor, time, type)
-                VALUES ({revlog_id}, {random_card_id}, {usn}, {REVIEW_EASE}, {SIMULATED_INTERVAL}, 
-                        {SIMULATED_LAST_INTERVAL}, {SIMULATED_FACTOR}, {REVIEW_TIME_MS}, {REVIEW_TYPE})
+                VALUES {row}
             """)
         else:
             input("Press Enter to confirm adding the review log entry...")
-            cursor.execute("""
-                INSERT INTO revlog (id, cid, usn, ease, ivl, lastIvl, factor, time, type)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (revlog_id, random_card_id, usn, REVIEW_EASE, SIMULATED_INTERVAL,
-                  SIMULATED_LAST_INTERVAL, SIMULATED_FACTOR, REVIEW_TIME_MS, REVIEW_TYPE))
-            conn.commit()
+            lock_ms = apply_revlog_rows(db_path, [row])
             print(f"Successfully added a review log entry for card {random_card_id} dated yesterday.")
+            print(f"Write lock held for {lock_ms:.1f} ms.")
 
 
 
@@ -133,8 +263,252 @@ def add_review_to_random_suspended_card(db_path):
         if conn:
             conn.close()
 
+
+def parse_date_range(start_date_str, end_date_str):
+    """Parses two 'YYYY-MM-DD' strings into dates. Returns None (after printing why) if invalid."""
+    try:
+        start_date = datetime.datetime.strptime(start_date_str, "%Y-%m-%d").date()
+        end_date = datetime.datetime.strptime(end_date_str, "%Y-%m-%d").date()
+    except ValueError:
+        print("Invalid date format. Use 'YYYY-MM-DD'.")
+        return None
+    if end_date < start_date:
+        print("The end date must not be before the start date.")
+        return None
+    return start_date, end_date
+
+
+def day_window_ms(day):
+    """Returns the [start, end) millisecond window from local midnight of day to the next midnight."""
+    start = datetime.datetime.combine(day, datetime.time())
+    end = start + datetime.timedelta(days=1)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def allocate_revlog_ids(cursor, target_ids):
+    """
+    Hands out one unique revlog id per target timestamp, on the same local day as the target.
+    Existing ids are fetched with one range query per target day, so only those days are loaded
+    however far apart they are. A target that is already taken moves to the next free millisecond
+    (wrapping inside its day), so the batch cannot conflict with the revlog or with itself and never
+    needs an insert retry.
+    """
+    targets_by_day = {}
+    for index, target in enumerate(target_ids):
+        day = datetime.datetime.fromtimestamp(target / 1000).date()
+        targets_by_day.setdefault(day, []).append(index)
+
+    allocated = [None] * len(target_ids)
+    for day, indices in targets_by_day.items():
+        window_start_ms, window_end_ms = day_window_ms(day)
+        cursor.execute("SELECT id FROM revlog WHERE id >= ? AND id < ?", (window_start_ms, window_end_ms))
+        taken = {row[0] for row in cursor}
+        if len(taken) + len(indices) > window_end_ms - window_start_ms:
+            raise ValueError(f"Not enough free revlog ids on {day}.")
+        for index in indices:
+            candidate = target_ids[index]
+            while candidate in taken:
+                candidate += 1
+                if candidate >= window_end_ms:
+                    candidate = window_start_ms
+            taken.add(candidate)
+            allocated[index] = candidate
+    return allocated
+
+
+def build_backfill_rows(cursor, card_ids, days, reviews_per_day):
+    """
+    Builds all revlog rows for the given days up front, cycling through card_ids in order.
+    Reviews for each day are spread evenly between BACKFILL_FIRST_HOUR and BACKFILL_LAST_HOUR,
+    with ids that do not collide with existing reviews.
+    """
+    usn = -1
+    window_ms = (BACKFILL_LAST_HOUR - BACKFILL_FIRST_HOUR) * 3600 * 1000
+    step_ms = max(1, window_ms // reviews_per_day)
+    target_ids = []
+    for day in days:
+        day_start = datetime.datetime.combine(day, datetime.time(hour=BACKFILL_FIRST_HOUR))
+        day_start_ms = int(day_start.timestamp() * 1000)
+        target_ids.extend(day_start_ms + i * step_ms for i in range(reviews_per_day))
+
+    rows = []
+    for revlog_id in allocate_revlog_ids(cursor, target_ids):
+        card_id = card_ids[len(rows) % len(card_ids)]
+        rows.append((revlog_id, card_id, usn, REVIEW_EASE, SIMULATED_INTERVAL,
+                     SIMULATED_LAST_INTERVAL, SIMULATED_FACTOR, REVIEW_TIME_MS, REVIEW_TYPE))
+    return rows
+
+
+def backfill_days(db_path, days, reviews_per_day):
+    """
+    Adds reviews_per_day review log entries for every date in days.
+    All rows are planned first, confirmed once, and inserted with executemany in a single transaction.
+    """
+    if not os.path.exists(db_path):
+        print(f"Error: Database file not found at {db_path}")
+        return
+    if not days:
+        print("No days to backfill.")
+        return
+    if reviews_per_day < 1:
+        print("REVIEWS_PER_DAY must be at least 1.")
+        return
+
+    conn = None
+    try:
+        conn = open_for_planning(db_path)
+        cursor = conn.cursor()
+
+        if CARD_ID:
+            card_ids = [CARD_ID]
+            print(f"Using specified card ID: {CARD_ID}")
+        else:
+            # Sample one distinct card per review; cards are only reused if the deck runs out
+            card_ids = sample_suspended_cards(cursor, DECK_NAME, len(days) * reviews_per_day)
+            if not card_ids:
+                print("No suspended cards found.")
+                return
+
+        rows = build_backfill_rows(cursor, card_ids, days, reviews_per_day)
+        rows = simulate_scheduling(cursor, rows)
+
+        # Planning is done; release the collection before waiting on the prompt
+        conn.close()
+        conn = None
+
+        distinct_cards = len({row[1] for row in rows})
+        print(f"Planned {len(rows)} review log entries: {reviews_per_day} per day for {len(days)} days "
+              f"({days[0]} to {days[-1]}), spread over {distinct_cards} cards.")
+
+        if DRY_RUN:
+            for row in rows[:5]:
+                print(row)
+            if len(rows) > 5:
+                print(f"... and {len(rows) - 5} more")
+            return
+
+        input("Press Enter to confirm adding all review log entries...")
+        lock_ms = apply_revlog_rows(db_path, rows)
+        print(f"Successfully added {len(rows)} review log entries. Write lock held for {lock_ms:.1f} ms.")
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+def backfill_reviews(db_path, start_date_str, end_date_str, reviews_per_day):
+    """Adds reviews_per_day review log entries for every day between the two dates (inclusive)."""
+    date_range = parse_date_range(start_date_str, end_date_str)
+    if not date_range:
+        return
+    start_date, end_date = date_range
+    days = [start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    backfill_days(db_path, days, reviews_per_day)
+
+
+def get_config_value(cursor, key, default=None):
+    """
+    Reads a collection config value. Newer collections keep it as JSON in the config table,
+    older ones in the col.conf JSON blob.
+    """
+    try:
+        cursor.execute("SELECT val FROM config WHERE KEY = ?", (key,))
+        row = cursor.fetchone()
+        if row is not None:
+            return json.loads(row[0])
+    except sqlite3.OperationalError:
+        pass  # No config table in older collections
+    cursor.execute("SELECT conf FROM col")
+    row = cursor.fetchone()
+    if row and row[0]:
+        return json.loads(row[0]).get(key, default)
+    return default
+
+
+def get_day_shift_seconds(cursor):
+    """
+    Returns the number of seconds to add to a unix timestamp so that integer division by 86400
+    gives the Anki day, honoring the collection's rollover hour and timezone.
+    The timezone is the collection's localOffset (minutes west of UTC) if set, otherwise the
+    machine's current UTC offset. A fixed offset is used, so reviews within an hour of the
+    rollover on DST change days may land on the neighbouring day.
+    """
+    rollover_hour = get_config_value(cursor, "rollover", 4)
+    local_offset = get_config_value(cursor, "localOffset")
+    if local_offset is not None:
+        utc_offset_s = -int(local_offset) * 60
+    else:
+        utc_offset_s = int(datetime.datetime.now().astimezone().utcoffset().total_seconds())
+    return utc_offset_s - int(rollover_hour) * 3600
+
+
+def find_review_gaps(cursor, start_date, end_date):
+    """
+    Returns every date between start_date and end_date (inclusive) with no reviews.
+    A single query walks the Anki days of the range and probes the revlog primary key for each
+    day's id window, so the cost grows with the number of days, not the size of the revlog.
+    """
+    epoch = datetime.date(1970, 1, 1)
+    shift_s = get_day_shift_seconds(cursor)
+    # ease = 0 rows are manual reschedules, which do not show up on the heatmap
+    cursor.execute("""
+        WITH RECURSIVE days(day) AS (
+            SELECT ? UNION ALL SELECT day + 1 FROM days WHERE day < ?
+        )
+        SELECT day FROM days
+        WHERE NOT EXISTS (
+            SELECT 1 FROM revlog
+            WHERE id >= (day * 86400 - ?) * 1000 AND id < ((day + 1) * 86400 - ?) * 1000 AND ease > 0
+        )
+    """, ((start_date - epoch).days, (end_date - epoch).days, shift_s, shift_s))
+    return [epoch + datetime.timedelta(days=row[0]) for row in cursor.fetchall()]
+
+
+def report_review_gaps(db_path, start_date_str, end_date_str, fill=False):
+    """Lists every day without reviews in the range, and optionally backfills those days."""
+    if not os.path.exists(db_path):
+        print(f"Error: Database file not found at {db_path}")
+        return
+    date_range = parse_date_range(start_date_str, end_date_str)
+    if not date_range:
+        return
+
+    conn = None
+    try:
+        conn = open_for_planning(db_path)
+        start = time.perf_counter()
+        gaps = find_review_gaps(conn.cursor(), *date_range)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return
+    finally:
+        if conn:
+            conn.close()
+
+    print(f"Found {len(gaps)} days without reviews between {start_date_str} and {end_date_str} ({elapsed_ms:.1f} ms):")
+    for day in gaps:
+        print(f"  {day}")
+
+    if fill and gaps:
+        backfill_days(db_path, gaps, REVIEWS_PER_DAY)
+
+
 # --- Main execution ---
 if __name__ == "__main__":
-    print("Attempting to add a review to a random suspended card...")
-    add_review_to_random_suspended_card(ANKI_DB_PATH)
+    if FIND_GAPS:
+        yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+        gap_end_date = GAP_END_DATE or yesterday
+        print(f"Looking for days without reviews from {GAP_START_DATE} to {gap_end_date}...")
+        report_review_gaps(ANKI_DB_PATH, GAP_START_DATE, gap_end_date, fill=FILL_GAPS)
+    elif BACKFILL_START_DATE and BACKFILL_END_DATE:
+        print(f"Attempting to backfill reviews from {BACKFILL_START_DATE} to {BACKFILL_END_DATE}...")
+        backfill_reviews(ANKI_DB_PATH, BACKFILL_START_DATE, BACKFILL_END_DATE, REVIEWS_PER_DAY)
+    else:
+        print("Attempting to add a review to a random suspended card...")
+        add_review_to_random_suspended_card(ANKI_DB_PATH)
     print("Script finished.")
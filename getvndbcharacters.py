@@ -1,5 +1,17 @@
 import requests
+import asyncio
+import atexit
 import json
+import math
+import time
+
+from rate_limit import AsyncTokenBucket, TokenBucket
+from response_cache import ResponseCache, make_key
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # Only needed for USE_ASYNC; without it the synchronous client is used
 
 # Comment out fields you want/don't want to include
 FIELDS_TO_GET = ['id',
@@ -15,125 +27,351 @@ FIELDS_TO_GET = ['id',
                 #  'example of field we want to not include',
                  ]
 
+API_URL = "https://api.vndb.org/kana"
+PAGE_SIZE = 100  # Maximum results per page allowed by the VNDB API
+
+# Batch mode: build a dictionary for every VN id listed in this file (one per line, # for comments)
+VN_IDS_FILE = None  # e.g. "vn_ids.txt"
+VNS_PER_REQUEST = 25  # VN ids combined into one ["or", ...] filter
+
+# Fetch the VN, the first character page and then all remaining pages concurrently with aiohttp
+# (falls back to the synchronous requests client when aiohttp is not installed)
+USE_ASYNC = True
+MAX_CONCURRENT_REQUESTS = 4
+
+# VNDB allows 200 requests per 5 minutes. A token bucket with a burst of RATE_LIMIT_BURST refilled at
+# (limit - burst) / window never sends more than the limit in any window.
+RATE_LIMIT_REQUESTS = 200
+RATE_LIMIT_WINDOW_S = 300
+RATE_LIMIT_BURST = 100
+MAX_RETRIES = 3  # Retries after a 429 reply
+
+# Successful responses are cached on disk, keyed by endpoint and request body
+USE_CACHE = True
+CACHE_PATH = "vndb_cache.sqlite"
+CACHE_MAX_BYTES = 100 * 1024 * 1024
+CACHE_TTL_SECONDS = 7 * 86400
+
+
+# One session for every request, so connections to VNDB are reused
+session = requests.Session()
+session.headers.update({"Content-Type": "application/json"})
+rate_limiter = TokenBucket((RATE_LIMIT_REQUESTS - RATE_LIMIT_BURST) / RATE_LIMIT_WINDOW_S, RATE_LIMIT_BURST)
+
+cache = None
+if USE_CACHE:
+    cache = ResponseCache(CACHE_PATH, CACHE_MAX_BYTES, CACHE_TTL_SECONDS, name="VNDB cache")
+    atexit.register(cache.print_stats)
+
+
+def post(endpoint, data):
+    """Rate-limited POST to a VNDB endpoint, retrying with backoff when VNDB answers 429."""
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        response = session.post(f"{API_URL}/{endpoint}", json=data)
+        if response.status_code != 429 or attempt == MAX_RETRIES:
+            return response
+        delay = float(response.headers.get("Retry-After", 5 * 2 ** attempt))
+        print(f"VNDB rate limit hit, retrying in {delay:.0f}s")
+        time.sleep(delay)
+
+
+def query(endpoint, data):
+    """
+    Returns the parsed response of a VNDB query, from the cache if a fresh copy is stored there.
+    Only cache misses reach the network (and the rate limiter). Raises requests.HTTPError on failure.
+    """
+    key = make_key(endpoint, data)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return json.loads(cached)
+    response = post(endpoint, data)
+    response.raise_for_status()
+    if cache:
+        cache.set(key, response.text)
+    return response.json()
+
 
 def get_vndb_data(vn_id):
-    url = "https://api.vndb.org/kana/vn"
-    headers = {"Content-Type": "application/json"}
     data = {
         "filters": ["id", "=", vn_id],
         "fields": "title,alttitle",
         "results": 1
     }
 
-    response = requests.post(url, headers=headers, json=data)
-
-    with open("vn_response.json", "w") as f:
-        f.write(response.text)
-
-    if response.status_code == 200:
-        return response.json()
-    else:
+    try:
+        return query("vn", data)
+    except requests.RequestException:
         print("Error: Unable to fetch VN data from VNDB")
         return None
 
 
-def get_vn_characters(vn_id):
-    url = "https://api.vndb.org/kana/character"
-    headers = {"Content-Type": "application/json"}
+def iter_pages(endpoint, data):
+    """
+    Posts a query to a VNDB endpoint and follows "more" from page to page, yielding the results
+    of each page as it arrives. Raises requests.HTTPError if a page can't be fetched.
+    """
+    page = 1
+    while True:
+        try:
+            body = query(endpoint, {**data, "results": PAGE_SIZE, "page": page})
+        except requests.HTTPError:
+            print(f"Error: Unable to fetch page {page} of {endpoint} results from VNDB")
+            raise
+        yield body["results"]
+        if not body.get("more"):
+            return
+        page += 1
+
+
+def iter_vn_characters(vn_id):
+    """Yields every character of a VN, one page of results at a time."""
     data = {
         "filters": ["vn", "=", ["id", "=", vn_id]],
         "fields": ",".join(FIELDS_TO_GET),
-        "results": 100
     }
+    for results in iter_pages("character", data):
+        yield from results
 
-    response = requests.post(url, headers=headers, json=data)
 
-    with open("character_response.json", "w") as f:
-        f.write(response.text)
+def character_entries(char, vn_name):
+    """Dictionary entries for one character: the full name, plus surname and given name when both are known."""
+    surname_char = {}
+    main_name_char = {}
+    char_data = {
+        "r": char['name'],
+        # You can modify this to get more names or kanji if needed
+        "s": [char['original']],
+        "l": []
+    }
 
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print("Error: Unable to fetch characters from VNDB")
-        return None
+    # Add additional info to the "l" field
+    if char.get('original'):
+        char_data["l"].append(f"Original: {char['original']}")
+        if len(char.get('original').split(' ')) == 2 and len(char.get('name').split(' ')) == 2:
+            surname_char["r"] = char.get('name').split(' ')[0]
+            surname_char["s"] = [char.get('original').split(' ')[0]]
+            surname_char["l"] = [
+                f"(Surname), {char.get('name').split(' ')[0]}"]
+            main_name_char["r"] = char.get('name').split(' ')[1]
+            main_name_char["s"] = [char.get('original').split(' ')[1]]
+            if char.get('sex'):
+                sex = "Male" if 'm' in char['sex'] else "Female"
+                main_name_char["l"] = [
+                    f"({sex}), {char.get('name').split(' ')[1]}"]
+            else:
+                main_name_char["l"] = [char.get('name').split(' ')[1]]
+    if char.get('sex'):
+        sex = "Male" if 'm' in char['sex'] else "Female"
+        char_data["l"].append(f"Sex: {sex}")
+    if char.get('birthday'):
+        char_data["l"].append(
+            f"Birthday: {char['birthday'][0]}月{char['birthday'][1]}日")
+    if char.get('height'):
+        char_data["l"].append(f"Height: {char['height']}")
+    if char.get('bust') and char.get('waist') and char.get('hips'):
+        measurements = f"B/W/H: {char['bust']}/{char['waist']}/{char['hips']}"
+        if char.get('cup'):
+            measurements += f", Cup Size: {char['cup']}"
+        char_data["l"].append(measurements)
+    if char.get('blood_type'):
+        char_data["l"].append(f"Blood type: {char['blood_type']}")
+    if char.get('age'):
+        char_data["l"].append(f"Age: {char['age']}")
+    # Add VN name to each character info
+    char_data["l"].append(f"VN: {vn_name}")
+
+    entries = [char_data]
+    if surname_char:
+        entries.append(surname_char)
+    if main_name_char:
+        entries.append(main_name_char)
+    return entries
 
 
 def build_json(vn_id):
     vn_data = get_vndb_data(vn_id)
-    characters = get_vn_characters(vn_id)
-
     print(vn_data)
-    print(characters)
+    if not vn_data:
+        return None
 
-    if vn_data and characters:
-        vn_name = vn_data['results'][0]['alttitle'] if vn_data['results'][0]['alttitle'] else vn_data['results'][0]['title']
-        json_output = [vn_name]
+    vn_name = vn_data['results'][0]['alttitle'] if vn_data['results'][0]['alttitle'] else vn_data['results'][0]['title']
+    json_output = [vn_name]
+    count = 0
+    try:
+        # Each page is turned into entries as it arrives, so only one page of raw results is held at a time
+        for char in iter_vn_characters(vn_id):
+            json_output.extend(character_entries(char, vn_name))
+            count += 1
+    except requests.RequestException as e:
+        print(f"Error: Unable to fetch characters from VNDB ({e})")
+        return None
+    print(f"Fetched {count} characters for {vn_name}")
+    return json_output
+
+
+def vn_title(vn):
+    return vn['alttitle'] if vn['alttitle'] else vn['title']
+
+
+def or_filter(field_filters):
+    return field_filters[0] if len(field_filters) == 1 else ["or", *field_filters]
+
+
+def build_json_batch(vn_ids):
+    """
+    Builds the dictionaries for many VNs at once. Titles and characters are fetched with combined
+    ["or", ...] filters of up to VNS_PER_REQUEST ids, and each character is attributed to the
+    requested VNs it appears in through its vns.id field. Returns {vn id: json output}.
+    """
+    vn_ids = list(dict.fromkeys(vn_ids))
+    outputs = {}
+    start = time.perf_counter()
+    requests_before = rate_limiter.acquired
+    for i in range(0, len(vn_ids), VNS_PER_REQUEST):
+        group = vn_ids[i:i + VNS_PER_REQUEST]
+        id_filter = or_filter([["id", "=", vn_id] for vn_id in group])
+        try:
+            titles = {vn['id']: vn_title(vn)
+                      for page in iter_pages("vn", {"filters": id_filter, "fields": "title,alttitle"})
+                      for vn in page}
+            for vn_id in group:
+                if vn_id in titles:
+                    outputs[vn_id] = [titles[vn_id]]
+                else:
+                    print(f"VN {vn_id} not found on VNDB")
+            wanted = set(titles)
+            data = {"filters": ["vn", "=", id_filter], "fields": ",".join(FIELDS_TO_GET + ["vns.id"])}
+            for page in iter_pages("character", data):
+                for char in page:
+                    for vn in char.get("vns", []):
+                        if vn["id"] in wanted:
+                            outputs[vn["id"]].extend(character_entries(char, titles[vn["id"]]))
+        except requests.RequestException as e:
+            print(f"Error: Unable to fetch VNs {group[0]}..{group[-1]} from VNDB ({e})")
+    print(f"Fetched {len(outputs)} of {len(vn_ids)} VNs in {rate_limiter.acquired - requests_before} requests, "
+          f"{time.perf_counter() - start:.1f}s")
+    return outputs
+
+
+class AsyncVNDBClient:
+    """
+    aiohttp client for the same queries as the synchronous functions above, sharing their cache.
+    Requests run concurrently, at most max_concurrency at a time and within the VNDB rate limit.
+
+        async with AsyncVNDBClient() as vndb:
+            json_output = await vndb.build_json("v17")
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENT_REQUESTS):
+        self.max_concurrency = max_concurrency
+        self.http = None
+
+    async def __aenter__(self):
+        self.http = aiohttp.ClientSession(headers={"Content-Type": "application/json"})
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.rate_limiter = AsyncTokenBucket((RATE_LIMIT_REQUESTS - RATE_LIMIT_BURST) / RATE_LIMIT_WINDOW_S,
+                                             RATE_LIMIT_BURST)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.http.close()
 
-        for char in characters['results']:
-            surname_char = {}
-            main_name_char = {}
-            char_data = {
-                "r": char['name'],
-                # You can modify this to get more names or kanji if needed
-                "s": [char['original']],
-                "l": []
-            }
-
-            # Add additional info to the "l" field
-            if char.get('original'):
-                char_data["l"].append(f"Original: {char['original']}")
-                if len(char.get('original').split(' ')) == 2 and len(char.get('name').split(' ')) == 2:
-                    surname_char["r"] = char.get('name').split(' ')[0]
-                    surname_char["s"] = [char.get('original').split(' ')[0]]
-                    surname_char["l"] = [
-                        f"(Surname), {char.get('name').split(' ')[0]}"]
-                    main_name_char["r"] = char.get('name').split(' ')[1]
-                    main_name_char["s"] = [char.get('original').split(' ')[1]]
-                    if char.get('sex'):
-                        sex = "Male" if 'm' in char['sex'] else "Female"
-                        main_name_char["l"] = [
-                            f"({sex}), {char.get('name').split(' ')[1]}"]
+    async def query(self, endpoint, data):
+        """Async version of query(): cached, rate limited, retried on 429. Raises aiohttp.ClientResponseError."""
+        key = make_key(endpoint, data)
+        if cache:
+            cached = cache.get(key)
+            if cached is not None:
+                return json.loads(cached)
+        for attempt in range(MAX_RETRIES + 1):
+            await self.rate_limiter.acquire()
+            async with self.semaphore:
+                async with self.http.post(f"{API_URL}/{endpoint}", json=data) as response:
+                    if response.status == 429 and attempt < MAX_RETRIES:
+                        delay = float(response.headers.get("Retry-After", 5 * 2 ** attempt))
                     else:
-                        main_name_char["l"] = [char.get('name').split(' ')[1]]
-            if char.get('sex'):
-                sex = "Male" if 'm' in char['sex'] else "Female"
-                char_data["l"].append(f"Sex: {sex}")
-            if char.get('birthday'):
-                char_data["l"].append(
-                    f"Birthday: {char['birthday'][0]}月{char['birthday'][1]}日")
-            if char.get('height'):
-                char_data["l"].append(f"Height: {char['height']}")
-            if char.get('bust') and char.get('waist') and char.get('hips'):
-                measurements = f"B/W/H: {char['bust']}/{char['waist']}/{char['hips']}"
-                if char.get('cup'):
-                    measurements += f", Cup Size: {char['cup']}"
-                char_data["l"].append(measurements)
-            if char.get('blood_type'):
-                char_data["l"].append(f"Blood type: {char['blood_type']}")
-            if char.get('age'):
-                char_data["l"].append(f"Age: {char['age']}")
-            # Add VN name to each character info
-            char_data["l"].append(f"VN: {vn_name}")
-
-            json_output.append(char_data)
-            if surname_char:
-                json_output.append(surname_char)
-            if main_name_char:
-                json_output.append(main_name_char)
+                        response.raise_for_status()
+                        text = await response.text()
+                        break
+            print(f"VNDB rate limit hit, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+        if cache:
+            cache.set(key, text)
+        return json.loads(text)
 
+    async def all_pages(self, endpoint, data):
+        """
+        Fetches page 1 with "count": true to learn how many pages there are, then every other page at
+        once. Returns all results in page order.
+        """
+        first = await self.query(endpoint, {**data, "results": PAGE_SIZE, "page": 1, "count": True})
+        pages = math.ceil(first.get("count", 0) / PAGE_SIZE)
+        rest = await asyncio.gather(*(self.query(endpoint, {**data, "results": PAGE_SIZE, "page": page})
+                                      for page in range(2, pages + 1)))
+        return [result for body in [first, *rest] for result in body["results"]]
+
+    async def build_json(self, vn_id):
+        """Async build_json: the VN and its character pages are requested concurrently."""
+        vn_data, characters = await asyncio.gather(
+            self.query("vn", {"filters": ["id", "=", vn_id], "fields": "title,alttitle", "results": 1}),
+            self.all_pages("character", {"filters": ["vn", "=", ["id", "=", vn_id]],
+                                         "fields": ",".join(FIELDS_TO_GET)}))
+        if not vn_data["results"]:
+            print(f"VN {vn_id} not found on VNDB")
+            return None
+        vn_name = vn_title(vn_data["results"][0])
+        json_output = [vn_name]
+        for char in characters:
+            json_output.extend(character_entries(char, vn_name))
+        print(f"Fetched {len(characters)} characters for {vn_name}")
         return json_output
-    else:
+
+
+def build_json_async(vn_id):
+    """
+    Runs AsyncVNDBClient.build_json from synchronous code, or build_json if aiohttp is not installed.
+    Returns None if a request fails.
+    """
+    if aiohttp is None:
+        print("aiohttp is not installed; fetching pages one at a time.")
+        return build_json(vn_id)
+
+    async def run():
+        async with AsyncVNDBClient() as vndb:
+            return await vndb.build_json(vn_id)
+    try:
+        return asyncio.run(run())
+    except aiohttp.ClientError as e:
+        print(f"Error: Unable to fetch data from VNDB ({e})")
         return None
 
 
+def read_vn_ids(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.split("#")[0].strip() for line in f if line.split("#")[0].strip()]
+
+
+def write_output(vn_id, json_result):
+    with open(f"{vn_id}.json", "w", encoding="utf-8") as f:
+        json.dump(json_result, f, indent=4, ensure_ascii=False)
+
+
 def main():
+    if VN_IDS_FILE:
+        outputs = build_json_batch(read_vn_ids(VN_IDS_FILE))
+        for vn_id, json_result in outputs.items():
+            write_output(vn_id, json_result)
+        print(f"Wrote {len(outputs)} dictionaries.")
+        return
+
     vn_id = input("Enter VNDB ID: ")
-    json_result = build_json(vn_id)
+    json_result = build_json_async(vn_id) if USE_ASYNC else build_json(vn_id)
 
     if json_result:
         print(json.dumps(json_result, indent=4, ensure_ascii=False))
-        with open(f"{vn_id}.json", "w", encoding="utf-8") as f:
-            json.dump(json_result, f, indent=4, ensure_ascii=False)
+        write_output(vn_id, json_result)
     else:
         print("Failed to generate JSON.")
 
@@ -0,0 +1,184 @@
+# Checkpointed, resumable queue of LLM jobs in SQLite
+# Each job is one prompt about one note. Workers claim jobs in batches and write answers back as
+# they finish, so a crash or Ctrl+C loses at most the batches in flight: the next run that queues
+# the same jobs resets them and only sends what is still unfinished. A run only ever works on the
+# jobs it queued itself; jobs of other prompts stay in the table untouched.
+
+import asyncio
+import hashlib
+import sqlite3
+import time
+
+from llm_runner import call_with_retries, MAX_CONCURRENCY, MAX_RETRIES, REQUESTS_PER_MINUTE
+from rate_limit import AsyncTokenBucket
+
+JOB_QUEUE_PATH = "llm_jobs.sqlite"
+CLAIM_BATCH = 16          # Jobs a worker claims per transaction
+PROGRESS_INTERVAL_S = 5   # Seconds between progress lines
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    note_id INTEGER NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, running, done, failed
+    response TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated REAL,
+    PRIMARY KEY (note_id, prompt_hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE TEMP TABLE IF NOT EXISTS run_jobs (
+    note_id INTEGER NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    PRIMARY KEY (note_id, prompt_hash)
+) WITHOUT ROWID;
+"""
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class JobQueue:
+    """
+    SQLite job table keyed by (note id, prompt hash). Re-adding a job that is already done is a
+    no-op, so changing the prompt creates new jobs while rerunning the same prompts resumes.
+    claim(), counts() and run_queue only see the jobs added through this JobQueue (the current run).
+    """
+
+    def __init__(self, path=JOB_QUEUE_PATH, retry_failed=True):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.retry_failed = retry_failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, jobs):
+        """
+        Queues (note_id, prompt) pairs for this run and returns the (note_id, prompt_hash) key of each.
+        Of these jobs, ones left running by a crashed run (and failed ones, with retry_failed) are
+        queued again.
+        """
+        keys = []
+        self.conn.execute("BEGIN")
+        for note_id, prompt in jobs:
+            key = (note_id, prompt_hash(prompt))
+            self.conn.execute("INSERT OR IGNORE INTO jobs (note_id, prompt_hash, prompt) VALUES (?, ?, ?)",
+                              (*key, prompt))
+            self.conn.execute("INSERT OR IGNORE INTO run_jobs (note_id, prompt_hash) VALUES (?, ?)", key)
+            keys.append(key)
+        statuses = "('running', 'failed')" if self.retry_failed else "('running')"
+        self.conn.execute(f"""
+            UPDATE jobs SET status = 'pending'
+            WHERE status IN {statuses}
+              AND EXISTS (SELECT 1 FROM run_jobs r WHERE r.note_id = jobs.note_id AND r.prompt_hash = jobs.prompt_hash)
+        """)
+        self.conn.execute("COMMIT")
+        return keys
+
+    def claim(self, n):
+        """
+        Marks up to n pending jobs of this run as running and returns them as (note_id, prompt_hash, prompt).
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        jobs = self.conn.execute("""
+            SELECT j.note_id, j.prompt_hash, j.prompt
+            FROM run_jobs r JOIN jobs j ON j.note_id = r.note_id AND j.prompt_hash = r.prompt_hash
+            WHERE j.status = 'pending' LIMIT ?
+        """, (n,)).fetchall()
+        self.conn.executemany("UPDATE jobs SET status = 'running' WHERE note_id = ? AND prompt_hash = ?",
+                              [job[:2] for job in jobs])
+        self.conn.execute("COMMIT")
+        return jobs
+
+    def finish(self, results):
+        """Stores (note_id, prompt_hash, response, error, attempts) results in one transaction."""
+        now = time.time()
+        self.conn.execute("BEGIN")
+        self.conn.executemany("""
+            UPDATE jobs SET status = ?, response = ?, error = ?, attempts = attempts + ?, updated = ?
+            WHERE note_id = ? AND prompt_hash = ?
+        """, [("failed" if error else "done", response, error, attempts, now, note_id, key)
+              for note_id, key, response, error, attempts in results])
+        self.conn.execute("COMMIT")
+
+    def counts(self):
+        """Returns {status: job count} for the jobs of this run."""
+        return dict(self.conn.execute("""
+            SELECT j.status, COUNT(*)
+            FROM run_jobs r JOIN jobs j ON j.note_id = r.note_id AND j.prompt_hash = r.prompt_hash
+            GROUP BY j.status
+        """))
+
+    def responses(self, keys):
+        """Returns {(note_id, prompt_hash): (status, response, error)} for the given job keys."""
+        found = {}
+        for note_id, key in keys:
+            row = self.conn.execute("SELECT status, response, error FROM jobs WHERE note_id = ? AND prompt_hash = ?",
+                                    (note_id, key)).fetchone()
+            if row:
+                found[(note_id, key)] = row
+        return found
+
+
+async def run_queue(backend, queue, requests_per_minute=REQUESTS_PER_MINUTE, max_concurrency=MAX_CONCURRENCY,
+                    max_retries=MAX_RETRIES, claim_batch=CLAIM_BATCH):
+    """
+    Works through the pending jobs of this run (those added with queue.add) with max_concurrency requests in flight, rate limited to
+    requests_per_minute. Prints throughput and an ETA every PROGRESS_INTERVAL_S seconds.
+    """
+    rate = requests_per_minute / 60
+    bucket = AsyncTokenBucket(rate, capacity=max(1, min(max_concurrency, int(rate))))
+    semaphore = asyncio.Semaphore(max_concurrency)
+    pending_at_start = queue.counts().get("pending", 0)
+    finished = 0
+    start = time.perf_counter()
+
+    async def run_job(note_id, key, prompt):
+        text, _, _, error, attempts = await call_with_retries(backend, prompt, bucket, semaphore, max_retries)
+        return note_id, key, text, str(error) if error else None, attempts
+
+    async def worker():
+        nonlocal finished
+        while True:
+            jobs = queue.claim(claim_batch)
+            if not jobs:
+                return
+            results = await asyncio.gather(*(run_job(*job) for job in jobs))
+            queue.finish(results)
+            finished += len(results)
+
+    def report(final=False):
+        elapsed = time.perf_counter() - start
+        per_second = finished / elapsed if elapsed else 0
+        remaining = pending_at_start - finished
+        eta = f"{remaining / per_second / 60:.1f} min" if per_second and remaining else "-"
+        label = "Done" if final else "Progress"
+        print(f"{label}: {finished}/{pending_at_start} jobs, {per_second:.2f} jobs/s, ETA {eta}")
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL_S)
+            report()
+
+    # Enough workers to keep every concurrency slot busy while others wait on their batch
+    workers = max(1, -(-max_concurrency // claim_batch) * 2)
+    progress = asyncio.create_task(reporter())
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    finally:
+        progress.cancel()
+    report(final=True)
+    counts = queue.counts()
+    if counts.get("failed"):
+        print(f"{counts['failed']} jobs failed; they are retried on the next run.")
@@ -0,0 +1,165 @@
+# Asyncio runner for asking an LLM one question per card
+# Requests go through a token bucket (requests per minute) and a concurrency limit, 429/5xx replies are
+# retried with exponential backoff, and results are yielded in input order as soon as they are ready.
+# Backends are pluggable: GeminiBackend talks to the API, FakeBackend simulates one offline.
+
+import asyncio
+import collections
+import json
+import random
+import time
+
+from rate_limit import AsyncTokenBucket
+
+REQUESTS_PER_MINUTE = 60  # Client-side rate limit; match your API quota
+MAX_CONCURRENCY = 8       # Requests in flight at once
+MAX_RETRIES = 5           # Retries per prompt on 429/5xx before giving up
+BACKOFF_BASE_S = 1.0      # First retry delay, doubled on every further retry
+BACKOFF_MAX_S = 60.0
+LOOKAHEAD = 4             # Prompts started ahead of the next result to yield, per concurrent slot
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+Result = collections.namedtuple("Result", "index text prompt_tokens output_tokens error attempts")
+
+
+class RetryableError(Exception):
+    """Raised by backends for rate limits and transient server errors."""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Backend:
+    """Interface for LLM backends: generate(prompt) returns (text, prompt_tokens, output_tokens)."""
+
+    async def generate(self, prompt):
+        raise NotImplementedError
+
+
+class GeminiBackend(Backend):
+    """Google GenAI backend using the client's async API (client.aio)."""
+
+    def __init__(self, client, model, config=None):
+        self.client = client
+        self.model = model
+        self.config = config or None
+
+    async def generate(self, prompt):
+        from google.genai import errors
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model, contents=prompt, config=self.config)
+        except errors.APIError as e:
+            if e.code in RETRYABLE_STATUS:
+                raise RetryableError(str(e), status=e.code) from e
+            raise
+        usage = response.usage_metadata
+        return (response.text or "",
+                (usage.prompt_token_count if usage else None) or 0,
+                (usage.candidates_token_count if usage else None) or 0)
+
+
+class FakeBackend(Backend):
+    """
+    Offline stand-in for benchmarking: answers after latency_s (plus up to jitter_s), fails with a
+    503 at failure_rate, and answers 429 when requests arrive faster than server_rpm (enforced per
+    second, so short benchmarks hit the quota too).
+    """
+
+    def __init__(self, latency_s=0.2, jitter_s=0.1, failure_rate=0.0, server_rpm=None, seed=0):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.failure_rate = failure_rate
+        self.server_rpm = server_rpm
+        self.random = random.Random(seed)
+        self.recent = collections.deque()
+        self.calls = 0
+
+    async def generate(self, prompt):
+        self.calls += 1
+        now = time.monotonic()
+        if self.server_rpm:
+            while self.recent and now - self.recent[0] >= 1:
+                self.recent.popleft()
+            if len(self.recent) >= max(1, self.server_rpm // 60):
+                raise RetryableError("429 Resource exhausted", status=429,
+                                     retry_after=1 - (now - self.recent[0]))
+            self.recent.append(now)
+        await asyncio.sleep(self.latency_s + self.random.random() * self.jitter_s)
+        if self.random.random() < self.failure_rate:
+            raise RetryableError("503 Service unavailable", status=503)
+        return f"answer to: {prompt[:40]}", len(prompt), 10
+
+
+class CachedBackend(Backend):
+    """Wraps a backend with a response_cache.ResponseCache; key_fn(prompt) builds the cache key."""
+
+    def __init__(self, backend, cache, key_fn):
+        self.backend = backend
+        self.cache = cache
+        self.key_fn = key_fn
+
+    async def generate(self, prompt):
+        key = self.key_fn(prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return tuple(json.loads(cached))
+        result = await self.backend.generate(prompt)
+        self.cache.set(key, json.dumps(result, ensure_ascii=False))
+        return result
+
+
+async def call_with_retries(backend, prompt, bucket, semaphore, max_retries=MAX_RETRIES):
+    """
+    Sends one prompt once the rate limiter and concurrency limit allow it, retrying RetryableErrors
+    with exponential backoff and jitter. Returns (text, prompt_tokens, output_tokens, error, attempts);
+    error is None on success.
+    """
+    for attempt in range(1, max_retries + 2):
+        await bucket.acquire()
+        try:
+            async with semaphore:
+                text, prompt_tokens, output_tokens = await backend.generate(prompt)
+            return text, prompt_tokens, output_tokens, None, attempt
+        except RetryableError as e:
+            if e.status == 429:
+                bucket.drain()
+            if attempt > max_retries:
+                return None, 0, 0, e, attempt
+            delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (attempt - 1))
+            delay = max(delay * (0.5 + random.random()), e.retry_after or 0)
+            await asyncio.sleep(delay)
+        except Exception as e:
+            return None, 0, 0, e, attempt
+
+
+async def run_ordered(backend, prompts, requests_per_minute=REQUESTS_PER_MINUTE,
+                      max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES):
+    """
+    Async generator that runs every prompt through backend and yields a Result per prompt, in input
+    order. Only max_concurrency * LOOKAHEAD prompts are started ahead of the next result, so
+    memory stays bounded however many prompts there are.
+    """
+    rate = requests_per_minute / 60
+    # Allow a burst of at most one second's worth of requests
+    bucket = AsyncTokenBucket(rate, capacity=max(1, min(max_concurrency, int(rate))))
+    semaphore = asyncio.Semaphore(max_concurrency)
+    window = max_concurrency * LOOKAHEAD
+    pending = collections.deque()
+
+    async def run_one(index, prompt):
+        return Result(index, *await call_with_retries(backend, prompt, bucket, semaphore, max_retries))
+
+    try:
+        for index, prompt in enumerate(prompts):
+            pending.append(asyncio.create_task(run_one(index, prompt)))
+            if len(pending) >= window:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
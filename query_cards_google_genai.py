@@ -1,9 +1,21 @@
-import requests
 import google.genai as genai
 from google.genai.types import GenerationConfig
+import asyncio
+import atexit
+import json
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 import dotenv
 
+from anki_connect import AnkiConnect
+from anki_mirror import get_mirrored_notes
+from job_queue import JobQueue, run_queue
+from llm_runner import CachedBackend, GeminiBackend, run_ordered
+from response_cache import ResponseCache, make_key
+from sentence_rank import top_k_indices
+
 
 # Get Gemini API key from environment variable
 # API_KEY = os.environ.get("GEMINI_API_KEY")
@@ -16,54 +28,311 @@ client = genai.Client(api_key=API_KEY)
 QUESTION = "Of all these sentences, which one is the most Samurai Jidai, and very cool and interesting?"
 SENTENCE_FIELD = "Sentence"
 QUERY = "tag:Game::Sekiro"
+MODEL = 'gemini-2.5-flash'
+GENERATION_SETTINGS = {}  # Passed as the generate_content config, e.g. {"temperature": 0.2}
+
+# Responses are cached on disk, keyed by model, prompt and generation settings
+USE_CACHE = True
+CACHE_PATH = "llm_cache.sqlite"
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+CACHE_TTL_SECONDS = 7 * 86400
+
+# Map-reduce mode for tags with too many sentences for one prompt: sentences are split into chunks
+# of at most CHUNK_TOKEN_BUDGET tokens, each chunk picks its WINNERS_PER_CHUNK best sentences
+# (up to MAX_PARALLEL_REQUESTS chunks at a time), and rounds repeat until the winners fit in one prompt.
+MAP_REDUCE = False
+CHUNK_TOKEN_BUDGET = 8000
+WINNERS_PER_CHUNK = 3
+MAX_PARALLEL_REQUESTS = 4
+
+# Local pre-ranking: score every sentence by character n-gram TF-IDF similarity to QUESTION and
+# PRERANK_SEEDS, and only send the PRERANK_TOP_K best to the model (None sends everything).
+# The question is usually English and the sentences Japanese, so a few seed sentences that look
+# like the answers you want rank much better than the question alone.
+PRERANK_TOP_K = None
+PRERANK_SEEDS = []  # e.g. ["拙者が参る。", "殿、御免！"]
+
+# Per-card mode: ask PER_CARD_QUESTION about every sentence separately instead of one question about
+# all of them. Requests are rate limited to REQUESTS_PER_MINUTE with at most MAX_CONCURRENT_REQUESTS
+# in flight, 429/5xx replies are retried with backoff, and answers print in card order as they arrive.
+PER_CARD = False
+PER_CARD_QUESTION = "Grade how natural this Japanese sentence is from 1 to 5 and name its main grammar point."
+REQUESTS_PER_MINUTE = 60
+MAX_CONCURRENT_REQUESTS = 8
+# Checkpoint per-card runs in a SQLite job queue: answers are saved as they arrive, and rerunning
+# after a crash only sends the cards that are still unfinished.
+USE_JOB_QUEUE = True
+JOB_QUEUE_PATH = "llm_jobs.sqlite"
+
+# Label mode: instead of a free-text answer, the model returns structured JSON ({"index", "label"}
+# objects for the numbered sentences). Indices are mapped back to note ids, and the labels are written
+# to Anki as tags (LABEL_TAG_PREFIX + label) and optionally into LABEL_FIELD, in batched multi requests.
+LABEL_MODE = False
+LABELS = ["samurai", "cool"]
+LABEL_TAG_PREFIX = "llm::"
+LABEL_FIELD = None  # e.g. "LLMLabel"; None only adds tags
+WRITE_BACK = True   # False prints the labels without touching Anki
 
 ANKICONNECT_URL = "http://localhost:8765"
+# Read notes from a local SQLite mirror that only syncs notes edited since the last run
+USE_MIRROR = False
+MIRROR_PATH = "anki_mirror.sqlite"
+
+anki = AnkiConnect(ANKICONNECT_URL)
+
+def get_anki_notes(query):
+    """
+    Fetch notes from Anki using AnkiConnect based on a query (note name or tag).
+    Each note is returned once, even if several of its cards match, with only SENTENCE_FIELD kept.
+    Returns a list of note dicts with noteId, fields, etc.
+    """
+    return anki.fetch_note_fields(query, [SENTENCE_FIELD])
+
+cache = None
+if USE_CACHE:
+    cache = ResponseCache(CACHE_PATH, CACHE_MAX_BYTES, CACHE_TTL_SECONDS, name="LLM response cache")
+    atexit.register(cache.print_stats)
+
+def generate(prompt, config=None):
+    """
+    Sends one prompt to the model, or answers it from the response cache.
+    config overrides GENERATION_SETTINGS. Returns (text, prompt_tokens, output_tokens).
+    """
+    settings = GENERATION_SETTINGS if config is None else config
+    key = make_key(MODEL, prompt, settings)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return tuple(json.loads(cached))
+
+    response = client.models.generate_content(
+        model=MODEL,
+        contents=prompt,
+        config=settings or None
+    )
+    usage = response.usage_metadata
+    prompt_tokens = (usage.prompt_token_count if usage else None) or estimate_tokens(prompt)
+    output_tokens = (usage.candidates_token_count if usage else None) or estimate_tokens(response.text or "")
+    result = (response.text or "", prompt_tokens, output_tokens)
+    if cache:
+        cache.set(key, json.dumps(result, ensure_ascii=False))
+    return result
+
+def estimate_tokens(text):
+    """Rough token estimate: about one token per Japanese character, four ASCII characters per token."""
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (len(text) - ascii_chars) + ascii_chars // 4 + 1
+
+def make_chunks(sentences, budget=CHUNK_TOKEN_BUDGET):
+    """Greedily packs sentences into chunks whose estimated size stays within the token budget."""
+    overhead = estimate_tokens(QUESTION) + 100
+    chunks, current, current_tokens = [], [], overhead
+    for sentence in sentences:
+        tokens = estimate_tokens(sentence) + 3
+        if current and current_tokens + tokens > budget:
+            chunks.append(current)
+            current, current_tokens = [], overhead
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def pick_winners(chunk):
+    """Asks the model for the chunk's best sentences. Returns (winners, prompt_tokens, output_tokens)."""
+    numbered = "\n".join(f"{i}. {sentence}" for i, sentence in enumerate(chunk, start=1))
+    prompt = (f"{QUESTION}\n"
+              f"Pick the {WINNERS_PER_CHUNK} best candidates from the numbered sentences below. "
+              f"Reply with only their numbers, one per line.\n\n{numbered}")
+    text, prompt_tokens, output_tokens = generate(prompt)
+    picked = []
+    for number in re.findall(r"\d+", text):
+        index = int(number) - 1
+        if 0 <= index < len(chunk) and chunk[index] not in picked:
+            picked.append(chunk[index])
+    # Fall back to the first sentences if the reply can't be parsed
+    return picked[:WINNERS_PER_CHUNK] or chunk[:WINNERS_PER_CHUNK], prompt_tokens, output_tokens
 
-def get_anki_cards(query):
+def reduce_candidates(sentences):
     """
-    Fetch cards from Anki using AnkiConnect based on a query (note name or tag).
-    Returns a list of card dicts with cardId, note fields, etc.
+    Runs the tournament rounds: each round sends every chunk to the model concurrently and keeps its
+    winners, until the remaining candidates fit in a single prompt. Returns those candidates.
     """
-    # Find card IDs matching the query (e.g., tag or deck)
-    payload = {
-        "action": "findCards",
-        "version": 6,
-        "params": {"query": query}
+    candidates = sentences
+    stage = 1
+    while len(make_chunks(candidates)) > 1:
+        chunks = make_chunks(candidates)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_REQUESTS) as pool:
+            results = list(pool.map(pick_winners, chunks))
+        winners = [sentence for picked, _, _ in results for sentence in picked]
+        print(f"Stage {stage}: {len(candidates)} sentences in {len(chunks)} chunks -> {len(winners)} winners, "
+              f"{time.perf_counter() - start:.1f}s, {sum(r[1] for r in results):,} prompt tokens, "
+              f"{sum(r[2] for r in results):,} output tokens")
+        if len(winners) >= len(candidates):
+            break  # No progress; a single sentence is larger than the budget
+        candidates = winners
+        stage += 1
+    return candidates
+
+def map_reduce(sentences):
+    """Runs the tournament and asks QUESTION about the final candidates. Returns the answer text."""
+    candidates = reduce_candidates(sentences)
+    start = time.perf_counter()
+    text, prompt_tokens, output_tokens = generate(f"{QUESTION}\n {candidates}")
+    print(f"Final stage: {len(candidates)} sentences, {time.perf_counter() - start:.1f}s, "
+          f"{prompt_tokens:,} prompt tokens, {output_tokens:,} output tokens")
+    return text
+
+def label_schema():
+    return {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "index": {"type": "INTEGER"},
+                "label": {"type": "STRING", "enum": LABELS},
+            },
+            "required": ["index", "label"],
+        },
     }
-    resp = requests.post(ANKICONNECT_URL, json=payload)
-    card_ids = resp.json().get("result", [])
-    if not card_ids:
+
+def label_sentences(sentences):
+    """
+    Asks QUESTION about the numbered sentences with JSON output enforced by a response schema.
+    Returns a list of (index into sentences, label); invalid indices and labels are dropped.
+    """
+    numbered = "\n".join(f"{i}. {sentence}" for i, sentence in enumerate(sentences, start=1))
+    prompt = (f"{QUESTION}\n"
+              f"Label the sentences that match with one of: {', '.join(LABELS)}. Reply with a JSON list of "
+              f"{{\"index\": sentence number, \"label\": label}} objects and leave out sentences that match "
+              f"no label.\n\n{numbered}")
+    config = {**GENERATION_SETTINGS, "response_mime_type": "application/json", "response_schema": label_schema()}
+    text, _, _ = generate(prompt, config)
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        print(f"Model did not return valid JSON: {text[:200]}")
         return []
-    # Get card info
-    payload = {
-        "action": "cardsInfo",
-        "version": 6,
-        "params": {"cards": card_ids}
-    }
-    resp = requests.post(ANKICONNECT_URL, json=payload)
-    return resp.json().get("result", [])
+    labeled = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        index, label = item.get("index"), item.get("label")
+        if isinstance(index, int) and 1 <= index <= len(sentences) and label in LABELS:
+            labeled.append((index - 1, label))
+    return labeled
+
+def write_labels(labeled_notes):
+    """Writes (note_id, label) pairs to Anki as tags, and into LABEL_FIELD if set, in batched multi requests."""
+    notes_by_tag = {}
+    for note_id, label in labeled_notes:
+        notes_by_tag.setdefault(LABEL_TAG_PREFIX + label.replace(" ", "_"), []).append(note_id)
+    start = time.perf_counter()
+    round_trips = anki.add_tags(notes_by_tag)
+    if LABEL_FIELD:
+        round_trips += anki.update_note_fields({note_id: {LABEL_FIELD: label} for note_id, label in labeled_notes})
+    print(f"Wrote {len(labeled_notes)} labels to Anki in {round_trips} requests, "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+def label_and_write_back(note_ids, sentences):
+    """LABEL_MODE: labels the sentences (after the tournament rounds if MAP_REDUCE) and writes them back."""
+    candidates = reduce_candidates(sentences) if MAP_REDUCE else sentences
+    # Tournament winners are sentence strings, so map them back to every note with that sentence
+    notes_by_sentence = {}
+    for note_id, sentence in zip(note_ids, sentences):
+        notes_by_sentence.setdefault(sentence, []).append(note_id)
+    labeled_notes = []
+    for index, label in label_sentences(candidates):
+        print(f"{label}: {candidates[index]}")
+        labeled_notes.extend((note_id, label) for note_id in notes_by_sentence[candidates[index]])
+    if WRITE_BACK and labeled_notes:
+        write_labels(labeled_notes)
+
+def per_card_backend():
+    backend = GeminiBackend(client, MODEL, GENERATION_SETTINGS)
+    if cache:
+        backend = CachedBackend(backend, cache, lambda prompt: make_key(MODEL, prompt, GENERATION_SETTINGS))
+    return backend
+
+def per_card_prompt(sentence):
+    return f"{PER_CARD_QUESTION}\n{sentence}"
+
+async def ask_per_card(sentences):
+    """Asks PER_CARD_QUESTION about each sentence and prints the answers in order as they stream in."""
+    backend = per_card_backend()
+    prompts = [per_card_prompt(sentence) for sentence in sentences]
+    start = time.perf_counter()
+    failed = 0
+    async for result in run_ordered(backend, prompts, REQUESTS_PER_MINUTE, MAX_CONCURRENT_REQUESTS):
+        if result.error:
+            failed += 1
+            print(f"[{result.index + 1}/{len(prompts)}] {sentences[result.index]}\n  Failed after "
+                  f"{result.attempts} attempts: {result.error}")
+        else:
+            print(f"[{result.index + 1}/{len(prompts)}] {sentences[result.index]}\n  {result.text.strip()}")
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(prompts)} cards in {elapsed:.1f}s ({len(prompts) / elapsed:.1f}/s), {failed} failed")
+
+def ask_per_card_queued(note_ids, sentences):
+    """
+    Per-card mode through the job queue: queues one job per note, works through the unfinished
+    ones with progress and ETA, then prints every answer in card order.
+    """
+    with JobQueue(JOB_QUEUE_PATH) as queue:
+        keys = queue.add((nid, per_card_prompt(s)) for nid, s in zip(note_ids, sentences))
+        print(f"Job queue: {queue.counts()}")
+        asyncio.run(run_queue(per_card_backend(), queue, REQUESTS_PER_MINUTE, MAX_CONCURRENT_REQUESTS))
+        answers = queue.responses(keys)
+    for i, (key, sentence) in enumerate(zip(keys, sentences), start=1):
+        status, response, error = answers.get(key, ("missing", None, None))
+        answer = response.strip() if status == "done" else f"Failed: {error}"
+        print(f"[{i}/{len(sentences)}] {sentence}\n  {answer}")
 
 def main():
     # query = input("Enter your Anki query (e.g., deck:Default or tag:mytag): ")
-    cards = get_anki_cards(QUERY)
+    if USE_MIRROR:
+        cards = get_mirrored_notes(QUERY, MIRROR_PATH, ANKICONNECT_URL)
+    else:
+        cards = get_anki_notes(QUERY)
     if not cards:
         print("No cards found for query.")
         return
     sentences = []
+    note_ids = []
     for card in cards:
         # Use the card's fields for context
         card_fields = card.get('fields', {})
         if SENTENCE_FIELD in card_fields:
             sentences.append(card_fields[SENTENCE_FIELD]['value'])
+            note_ids.append(card['noteId'])
     card_text = " | ".join([f"{k}: {v['value']}" for k, v in card_fields.items()])
-    
-    prompt = f"{QUESTION}\n {sentences}"
-    response = client.models.generate_content(
-    model='gemini-2.5-flash',
-    contents=prompt
-    )
+
+    if PRERANK_TOP_K is not None and len(sentences) > PRERANK_TOP_K:
+        start = time.perf_counter()
+        total = len(sentences)
+        top = top_k_indices(sentences, [QUESTION] + PRERANK_SEEDS, PRERANK_TOP_K)
+        sentences = [sentences[i] for i in top]
+        note_ids = [note_ids[i] for i in top]
+        print(f"Pre-ranked {total} sentences locally in {(time.perf_counter() - start) * 1000:.0f} ms, "
+              f"sending the top {len(sentences)}.")
+
+    if PER_CARD:
+        if USE_JOB_QUEUE:
+            ask_per_card_queued(note_ids, sentences)
+        else:
+            asyncio.run(ask_per_card(sentences))
+        return
+    if LABEL_MODE:
+        label_and_write_back(note_ids, sentences)
+        return
+    if MAP_REDUCE:
+        response_text = map_reduce(sentences)
+    else:
+        prompt = f"{QUESTION}\n {sentences}"
+        response_text, _, _ = generate(prompt)
     print(f"Card: {card_text}")
-    print(f"Response: {response.text}\n")
+    print(f"Response: {response_text}\n")
 
 if __name__ == "__main__":
     main()
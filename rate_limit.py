@@ -0,0 +1,56 @@
+# Token buckets for client-side rate limiting
+# TokenBucket blocks the calling thread (requests-based scripts); AsyncTokenBucket awaits instead
+# (asyncio clients). Both refill at rate tokens per second up to capacity, which is the allowed burst.
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Blocking token bucket: acquire() waits until another request may be sent."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.acquired = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.acquired += 1
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0
+            self.tokens -= 1
+        if wait:
+            time.sleep(wait)
+
+
+class AsyncTokenBucket:
+    """Async token bucket: acquire() waits until a request may be sent at rate requests per second."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def drain(self):
+        """Drops any saved-up burst, e.g. after the server answered 429."""
+        self.tokens = min(self.tokens, 0)
@@ -0,0 +1,85 @@
+# Persistent on-disk response cache in SQLite with a TTL and size-bounded LRU eviction
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+"""
+
+
+def make_key(*parts):
+    """Hashes any JSON-serializable parts (model name, prompt, settings, ...) into a cache key."""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Key/value cache of text responses. Entries older than ttl_seconds are treated as missing,
+    and the least recently used entries are evicted once the stored values exceed max_bytes.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, ttl_seconds=7 * 86400, name="cache"):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def get(self, key):
+        """Returns the cached value for key, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    with self.conn:
+                        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        """Stores value under key, then evicts least recently used entries beyond max_bytes."""
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now))
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                evict = []
+                for old_key, old_size in self.conn.execute(
+                        "SELECT key, size FROM entries WHERE key != ? ORDER BY last_access", (key,)):
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((old_key,))
+                    total -= old_size
+                self.conn.executemany("DELETE FROM entries WHERE key = ?", evict)
+
+    def print_stats(self):
+        total = self.hits + self.misses
+        rate = f"{self.hits / total:.0%}" if total else "-"
+        print(f"{self.name}: {self.hits} hits, {self.misses} misses ({rate} hit rate)")
+
+    def close(self):
+        self.conn.close()
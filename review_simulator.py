@@ -0,0 +1,175 @@
+import json
+
+import numpy as np
+
+# Vectorized SM-2 / FSRS replay used by cheatheatmapyesterday.py to give synthetic reviews
+# plausible ivl / lastIvl / factor values instead of fixed placeholders.
+
+# FSRS-4.5 default parameters
+FSRS_WEIGHTS = [0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474, 0.1367,
+                1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755]
+FSRS_DECAY = -0.5
+FSRS_FACTOR = 19 / 81
+DESIRED_RETENTION = 0.9
+
+# SM-2 (Anki v2/v3 scheduler) defaults
+STARTING_FACTOR = 2500
+MINIMUM_FACTOR = 1300
+EASY_BONUS = 1.3
+HARD_MULTIPLIER = 1.2
+MAXIMUM_INTERVAL = 36500
+
+DAY_MS = 86400 * 1000
+
+
+def load_card_history(cursor, card_ids):
+    """
+    Loads the revlog history of all given cards with one query.
+    Returns NumPy arrays (cid, id, ease, ivl, factor) sorted by card, then time.
+    """
+    cursor.execute("""
+        SELECT cid, id, ease, ivl, factor FROM revlog
+        WHERE cid IN (SELECT value FROM json_each(?)) AND ease > 0
+        ORDER BY cid, id
+    """, (json.dumps([int(c) for c in set(card_ids)]),))
+    rows = cursor.fetchall()
+    if not rows:
+        return tuple(np.empty(0, dtype=np.int64) for _ in range(5))
+    history = np.array(rows, dtype=np.int64)
+    return tuple(history[:, i] for i in range(5))
+
+
+def _rounds(keys):
+    """
+    For each element of keys (in the given order), its occurrence number among equal keys.
+    Elements with the same occurrence number never share a key, so each round can be applied at once.
+    """
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    lengths = np.diff(np.r_[starts, len(keys)])
+    rank_sorted = np.arange(len(keys)) - np.repeat(starts, lengths)
+    ranks = np.empty(len(keys), dtype=np.int64)
+    ranks[order] = rank_sorted
+    return ranks
+
+
+class SchedulerState:
+    """SM-2 and FSRS memory state for a set of cards, updated with array operations."""
+
+    def __init__(self, n_cards):
+        self.seen = np.zeros(n_cards, dtype=bool)
+        self.last_ms = np.zeros(n_cards, dtype=np.int64)
+        self.ivl = np.zeros(n_cards, dtype=np.float64)
+        self.factor = np.full(n_cards, STARTING_FACTOR, dtype=np.float64)
+        self.stability = np.zeros(n_cards, dtype=np.float64)
+        self.difficulty = np.zeros(n_cards, dtype=np.float64)
+
+    def review(self, idx, ease, now_ms, model):
+        """
+        Applies one review to the cards at idx (no duplicates) and returns the new interval in days.
+        ease and now_ms are arrays aligned with idx.
+        """
+        w = FSRS_WEIGHTS
+        ease = ease.astype(np.float64)
+        seen = self.seen[idx]
+        elapsed = np.maximum(0.0, (now_ms - self.last_ms[idx]) / DAY_MS)
+        ivl = self.ivl[idx]
+        factor = self.factor[idx]
+
+        # --- SM-2 ---
+        again, hard, good, easy = (ease == 1), (ease == 2), (ease == 3), (ease == 4)
+        factor = np.where(again, factor - 200, factor)
+        factor = np.where(hard, factor - 150, factor)
+        factor = np.where(easy, factor + 150, factor)
+        factor = np.maximum(factor, MINIMUM_FACTOR)
+        days_late = np.maximum(0.0, elapsed - ivl)
+        sm2_ivl = np.select(
+            [again, hard, good, easy],
+            [np.ones_like(ivl),
+             np.maximum(ivl + 1, ivl * HARD_MULTIPLIER),
+             np.maximum(ivl + 1, (ivl + days_late / 2) * factor / 1000),
+             np.maximum(ivl + 1, (ivl + days_late) * factor / 1000 * EASY_BONUS)])
+        # New cards graduate straight from learning
+        sm2_ivl = np.where(seen, sm2_ivl, np.where(easy, 4.0, 1.0))
+
+        # --- FSRS ---
+        stability = self.stability[idx]
+        difficulty = self.difficulty[idx]
+        init_s = np.take(w[0:4], ease.astype(np.int64) - 1)
+        init_d = np.clip(w[4] - (ease - 3) * w[5], 1, 10)
+
+        safe_s = np.where(stability > 0, stability, 1.0)
+        retrievability = np.power(1 + FSRS_FACTOR * elapsed / safe_s, FSRS_DECAY)
+        next_d = difficulty - w[6] * (ease - 3)
+        next_d = np.clip(w[7] * (w[4] - (4 - 3) * w[5]) + (1 - w[7]) * next_d, 1, 10)
+        modifier = np.where(hard, w[15], 1.0) * np.where(easy, w[16], 1.0)
+        success_s = safe_s * (np.exp(w[8]) * (11 - difficulty) * np.power(safe_s, -w[9])
+                              * (np.exp(w[10] * (1 - retrievability)) - 1) * modifier + 1)
+        lapse_s = (w[11] * np.power(np.maximum(difficulty, 1), -w[12])
+                   * (np.power(safe_s + 1, w[13]) - 1) * np.exp(w[14] * (1 - retrievability)))
+        next_s = np.where(again, np.minimum(lapse_s, safe_s), success_s)
+        next_s = np.where(seen, next_s, init_s)
+        next_d = np.where(seen, next_d, init_d)
+        fsrs_ivl = next_s / FSRS_FACTOR * (DESIRED_RETENTION ** (1 / FSRS_DECAY) - 1)
+
+        new_ivl = fsrs_ivl if model == "fsrs" else sm2_ivl
+        new_ivl = np.clip(np.rint(new_ivl), 1, MAXIMUM_INTERVAL)
+
+        self.seen[idx] = True
+        self.last_ms[idx] = now_ms
+        self.ivl[idx] = new_ivl
+        self.factor[idx] = np.where(seen, factor, STARTING_FACTOR)
+        self.stability[idx] = next_s
+        self.difficulty[idx] = next_d
+        return new_ivl
+
+
+def simulate_reviews(cursor, card_ids, review_ms, ease, model="fsrs"):
+    """
+    Replays the existing revlog history of all target cards together with the planned synthetic
+    reviews, merged in time order, so a synthetic review only sees the history before its date.
+    Returns (ivl, last_ivl, factor) integer arrays aligned with card_ids.
+    model selects which scheduler ("sm2" or "fsrs") produces the intervals; factor is always SM-2's.
+    """
+    card_ids = np.asarray(card_ids, dtype=np.int64)
+    review_ms = np.asarray(review_ms, dtype=np.int64)
+    ease = np.broadcast_to(np.asarray(ease, dtype=np.int64), card_ids.shape)
+    if len(card_ids) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    cards, card_index = np.unique(card_ids, return_inverse=True)
+    state = SchedulerState(len(cards))
+    hist_cid, hist_id, hist_ease, hist_ivl, hist_factor = load_card_history(cursor, cards.tolist())
+
+    # One event list: real reviews (synthetic position -1) followed by the synthetic ones
+    no_value = np.zeros(len(card_ids), dtype=np.int64)
+    event_idx = np.concatenate((np.searchsorted(cards, hist_cid), card_index))
+    event_ms = np.concatenate((hist_id, review_ms))
+    event_ease = np.concatenate((hist_ease, ease))
+    recorded_ivl = np.concatenate((hist_ivl, no_value))
+    recorded_factor = np.concatenate((hist_factor, no_value))
+    synth_pos = np.concatenate((np.full(len(hist_cid), -1, dtype=np.int64), np.arange(len(card_ids))))
+
+    # Per card in time order (a real review first on a tie), one review per card per round
+    chronological = np.lexsort((synth_pos >= 0, event_ms, event_idx))
+    event_round = np.empty(len(event_idx), dtype=np.int64)
+    event_round[chronological] = _rounds(event_idx[chronological])
+
+    ivl_out = np.zeros(len(card_ids), dtype=np.int64)
+    last_ivl_out = np.zeros(len(card_ids), dtype=np.int64)
+    factor_out = np.zeros(len(card_ids), dtype=np.int64)
+    for r in range(int(event_round.max()) + 1):
+        sel = np.flatnonzero(event_round == r)
+        idx = event_idx[sel]
+        pos = synth_pos[sel]
+        synthetic = pos >= 0
+        last_ivl_out[pos[synthetic]] = state.ivl[idx[synthetic]]
+        new_ivl = state.review(idx, event_ease[sel], event_ms[sel], model)
+        ivl_out[pos[synthetic]] = new_ivl[synthetic]
+        # Recorded values are ground truth where Anki stored them (ivl < 0 are learning steps in seconds)
+        state.ivl[idx] = np.where(recorded_ivl[sel] > 0, recorded_ivl[sel], state.ivl[idx])
+        state.factor[idx] = np.where(recorded_factor[sel] > 0, recorded_factor[sel], state.factor[idx])
+        factor_out[pos[synthetic]] = state.factor[idx[synthetic]]
+    return ivl_out, last_ivl_out, factor_out
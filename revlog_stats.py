@@ -0,0 +1,185 @@
+import sqlite3
+import time
+import datetime
+import os
+import pathlib
+
+import numpy as np
+
+from cheatheatmapyesterday import ANKI_DB_PATH, get_day_shift_seconds
+
+# --- Configuration ---
+# Read-side companion to cheatheatmapyesterday.py: heatmap and retention analytics over the revlog.
+# The collection path is taken from cheatheatmapyesterday.py.
+REVLOG_CACHE_PATH = "revlog_cache.npz"  # Set to None to always load from the database
+BATCH_SIZE = 100000  # Rows fetched from SQLite per batch
+RECENT_DAYS = 30  # Number of recent days to show in the daily summary
+
+# Interval buckets (in days) for the retention table: [1], [2, 3], [4, 7], ...
+RETENTION_BUCKETS = [1, 2, 4, 8, 15, 31, 91, 181]
+
+# --- Don't modify below this line unless you know what you're doing ---
+
+REVLOG_COLUMNS = {
+    'id': np.int64,
+    'cid': np.int64,
+    'ease': np.int8,
+    'ivl': np.int32,
+    'lastIvl': np.int32,
+    'time': np.int32,
+    'type': np.int8,
+}
+
+
+def _empty_revlog():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in REVLOG_COLUMNS.items()}
+
+
+def _load_cache(cache_path):
+    if not cache_path or not os.path.exists(cache_path):
+        return None
+    with np.load(cache_path) as data:
+        if any(name not in data for name in REVLOG_COLUMNS):
+            return None  # Cache written with different columns
+        return {name: data[name] for name in REVLOG_COLUMNS}
+
+
+def fetch_revlog_rows(cursor, after_id, batch_size=BATCH_SIZE):
+    """Streams revlog rows with id > after_id into typed NumPy column arrays, batch by batch."""
+    cursor.execute(f"SELECT {', '.join(REVLOG_COLUMNS)} FROM revlog WHERE id > ? ORDER BY id", (after_id,))
+    batches = {name: [] for name in REVLOG_COLUMNS}
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        block = np.array(rows, dtype=np.int64)
+        for i, (name, dtype) in enumerate(REVLOG_COLUMNS.items()):
+            batches[name].append(block[:, i].astype(dtype))
+    return {name: np.concatenate(parts) if parts else np.empty(0, dtype=REVLOG_COLUMNS[name])
+            for name, parts in batches.items()}
+
+
+def load_revlog(db_path, cache_path=REVLOG_CACHE_PATH):
+    """
+    Loads the revlog as a dict of NumPy arrays sorted by id.
+    The .npz cache is keyed on the max revlog id it contains: later loads only fetch rows with a
+    higher id. If rows were added or removed below that id (e.g. by a backfill), the cache is rebuilt.
+    Returns (revlog, day_shift_seconds).
+    """
+    conn = sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        cursor = conn.cursor()
+        cursor.arraysize = BATCH_SIZE
+        day_shift = get_day_shift_seconds(cursor)
+
+        revlog = _load_cache(cache_path)
+        if revlog is not None and len(revlog['id']):
+            cached_max_id = int(revlog['id'][-1])
+            cursor.execute("SELECT COUNT(*) FROM revlog WHERE id <= ?", (cached_max_id,))
+            if cursor.fetchone()[0] != len(revlog['id']):
+                print("Revlog changed below the cached max id, rebuilding cache...")
+                revlog = None
+        if revlog is None:
+            revlog = _empty_revlog()
+
+        after_id = int(revlog['id'][-1]) if len(revlog['id']) else -1
+        new_rows = fetch_revlog_rows(cursor, after_id)
+    finally:
+        conn.close()
+
+    if len(new_rows['id']):
+        revlog = {name: np.concatenate((revlog[name], new_rows[name])) for name in REVLOG_COLUMNS}
+        if cache_path:
+            np.savez(cache_path, **revlog)
+    print(f"Loaded {len(revlog['id']):,} revlog rows ({len(new_rows['id']):,} new).")
+    return revlog, day_shift
+
+
+def review_days(revlog, day_shift):
+    """Returns the Anki day number (days since the epoch, honoring rollover) of each review."""
+    return (revlog['id'] // 1000 + day_shift) // 86400
+
+
+def daily_totals(revlog, day_shift):
+    """
+    Returns (days, counts, time_ms) for every day with at least one review.
+    Manual reschedules (ease 0) are excluded, like on Anki's heatmap.
+    """
+    mask = revlog['ease'] > 0
+    days = review_days(revlog, day_shift)[mask]
+    if len(days) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    first = days.min()
+    counts = np.bincount(days - first)
+    time_ms = np.bincount(days - first, weights=revlog['time'][mask]).astype(np.int64)
+    reviewed = np.flatnonzero(counts)
+    return reviewed + first, counts[reviewed], time_ms[reviewed]
+
+
+def streaks(days, today):
+    """Returns (current_streak, longest_streak) in days from a sorted array of reviewed days."""
+    if len(days) == 0:
+        return 0, 0
+    breaks = np.flatnonzero(np.diff(days) != 1)
+    run_starts = np.concatenate(([0], breaks + 1))
+    run_ends = np.concatenate((breaks, [len(days) - 1]))
+    lengths = run_ends - run_starts + 1
+    # The current streak still counts if today has no reviews yet
+    current = int(lengths[-1]) if days[-1] >= today - 1 else 0
+    return current, int(lengths.max())
+
+
+def retention_by_interval(revlog, buckets=RETENTION_BUCKETS):
+    """
+    Retention of review-type answers (type 1), grouped by the card's interval before the review (lastIvl).
+    Returns a list of (bucket_label, reviews, passed).
+    """
+    last_ivl = revlog['lastIvl']
+    # Negative intervals are learning steps in seconds
+    mask = (revlog['type'] == 1) & (revlog['ease'] > 0) & (last_ivl > 0)
+    bucket = np.searchsorted(buckets, last_ivl[mask], side='right') - 1
+    reviews = np.bincount(bucket, minlength=len(buckets))
+    passed = np.bincount(bucket, weights=revlog['ease'][mask] > 1, minlength=len(buckets)).astype(np.int64)
+
+    result = []
+    for i, low in enumerate(buckets):
+        high = buckets[i + 1] - 1 if i + 1 < len(buckets) else None
+        label = f"{low}d" if high == low else (f"{low}-{high}d" if high else f"{low}d+")
+        result.append((label, int(reviews[i]), int(passed[i])))
+    return result
+
+
+def main():
+    if not os.path.exists(ANKI_DB_PATH):
+        print(f"Error: Database file not found at {ANKI_DB_PATH}")
+        return
+
+    start = time.perf_counter()
+    revlog, day_shift = load_revlog(ANKI_DB_PATH)
+    loaded = time.perf_counter()
+
+    days, counts, time_ms = daily_totals(revlog, day_shift)
+    today = (int(time.time()) + day_shift) // 86400
+    current_streak, longest_streak = streaks(days, today)
+    retention = retention_by_interval(revlog) if len(revlog['id']) else []
+    done = time.perf_counter()
+
+    epoch = datetime.date(1970, 1, 1)
+    print(f"\nDays studied: {len(days):,}")
+    print(f"Current streak: {current_streak} days, longest streak: {longest_streak} days")
+    print(f"\nLast {RECENT_DAYS} days:")
+    recent = {int(d): (int(c), int(t)) for d, c, t in zip(days, counts, time_ms) if d > today - RECENT_DAYS}
+    for day in range(today - RECENT_DAYS + 1, today + 1):
+        count, spent_ms = recent.get(day, (0, 0))
+        print(f"  {epoch + datetime.timedelta(days=day)}: {count:5d} reviews, {spent_ms / 60000:6.1f} min")
+
+    print("\nRetention by interval (review cards):")
+    for label, reviews, passed in retention:
+        rate = f"{passed / reviews:.1%}" if reviews else "-"
+        print(f"  {label:>8}: {rate:>6} of {reviews:,} reviews")
+
+    print(f"\nLoad: {(loaded - start) * 1000:.0f} ms, aggregates: {(done - loaded) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Offline pre-ranking of sentences with character n-gram TF-IDF
+# Everything is vectorized: n-grams are hashed straight from the UTF-32 code points with NumPy and
+# collected into a SciPy sparse matrix, so 100k sentences rank in a fraction of a second.
+
+import numpy as np
+import scipy.sparse as sp
+
+NGRAM_RANGE = (1, 3)   # Character n-gram sizes to use
+N_FEATURES = 2 ** 20   # Hashed feature space
+
+_HASH_MULTIPLIER = np.uint32(0x9E3779B1)
+_HASH_PRIME = np.uint32(16777619)
+
+
+def _hashed_ngrams(texts, ngram_range=NGRAM_RANGE, n_features=N_FEATURES):
+    """Returns (rows, cols) of every character n-gram occurrence, with n-grams hashed to column ids."""
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int32, count=len(texts))
+    # One separator after each text keeps n-grams from spanning two texts
+    codepoints = np.frombuffer(("\0".join(texts) + "\0").encode("utf-32-le"), dtype=np.uint32)
+    text_of_pos = np.repeat(np.arange(len(texts), dtype=np.int32), lengths + 1)
+    # Characters left in the text from each position on; an n-gram fits where at least n are left
+    separators = np.cumsum(lengths + 1, dtype=np.int32) - 1
+    remaining = separators[text_of_pos] - np.arange(len(codepoints), dtype=np.int32)
+
+    rows, cols = [], []
+    shift = np.uint32(32 - int(np.log2(n_features)))
+    # Rolling 32-bit hash: the hashes of the n-grams are extended by one character for n + 1
+    h = np.zeros(len(codepoints), dtype=np.uint32)
+    for n in range(1, ngram_range[1] + 1):
+        count = len(codepoints) - n + 1
+        if count <= 0:
+            break
+        h = h[:count] * _HASH_PRIME + codepoints[n - 1:n - 1 + count]
+        if n < ngram_range[0]:
+            continue
+        valid = remaining[:count] >= n
+        rows.append(text_of_pos[:count][valid])
+        cols.append(((h[valid] * _HASH_MULTIPLIER) >> shift).astype(np.int32))
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def _tf_matrix(texts):
+    rows, cols = _hashed_ngrams(texts)
+    matrix = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                           shape=(len(texts), N_FEATURES))
+    matrix.sum_duplicates()
+    matrix.data = 1 + np.log(matrix.data)  # Sublinear term frequency
+    return matrix
+
+
+def _apply_idf(matrix, idf):
+    """Scales the term frequencies by idf and L2-normalizes each row, in place on the CSR data."""
+    matrix.data *= idf[matrix.indices]
+    row_of_value = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    norms = np.sqrt(np.bincount(row_of_value, weights=matrix.data ** 2, minlength=matrix.shape[0]))
+    norms[norms == 0] = 1
+    matrix.data /= norms[row_of_value].astype(np.float32)
+    return matrix
+
+
+def rank_sentences(sentences, queries):
+    """
+    Scores every sentence against the queries (question text and/or seed example sentences) by
+    cosine similarity of character n-gram TF-IDF vectors. A sentence's score is its best match
+    over all queries. Returns a float array aligned with sentences.
+    """
+    if not sentences or not queries:
+        return np.zeros(len(sentences))
+    docs = _tf_matrix(sentences)
+    document_frequency = np.bincount(docs.indices, minlength=N_FEATURES)
+    idf = (np.log((1 + len(sentences)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+    docs = _apply_idf(docs, idf)
+    query_vectors = _apply_idf(_tf_matrix(queries), idf)
+    scores = (docs @ query_vectors.T).toarray()
+    return scores.max(axis=1)
+
+
+def top_k_indices(sentences, queries, k):
+    """Returns the indices of the k sentences most similar to the queries, best first."""
+    if k >= len(sentences):
+        k = len(sentences)
+    scores = rank_sentences(sentences, queries)
+    top = np.argpartition(-scores, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+    return top[np.argsort(-scores[top], kind='stable')]
+
@@ -1,7 +1,135 @@
 import re
+import wave
 
+import numpy as np
 
-def create_srt_file_flexible(text_data, output_filename="output.srt"):
+# --- Audio auto-timing (optional) ---
+# Transcript times only have second precision, so every cue can drift by up to a second.
+# Set AUDIO_PATH to the episode's audio (PCM WAV) to snap each cue's start/end to the
+# nearest speech boundary found by an energy-based voice activity detector.
+AUDIO_PATH = None
+VAD_HOP_MS = 10            # Analysis frame length in milliseconds
+VAD_SMOOTH_FRAMES = 5      # Moving-average window (in frames) applied to the energy curve
+VAD_THRESHOLD_DB = 12.0    # How far above the noise floor a frame must be to count as speech
+VAD_MIN_SILENCE_MS = 150   # Pauses shorter than this are treated as part of the same utterance
+VAD_MIN_SPEECH_MS = 100    # Bursts shorter than this are ignored (clicks, breaths)
+SNAP_MAX_SHIFT_S = 1.0     # Never move a cue boundary further than this
+
+
+def read_frame_energy(audio_path, hop_ms=VAD_HOP_MS, block_seconds=60):
+    """
+    Reads a PCM WAV file and returns (energy_db, hop_seconds), one energy value per
+    hop_ms frame. The file is processed in blocks so an hour of audio never has to be
+    converted to floating point all at once.
+    """
+    with wave.open(audio_path, 'rb') as wf:
+        n_channels = wf.getnchannels()
+        sample_width = wf.getsampwidth()
+        sample_rate = wf.getframerate()
+        hop = max(1, int(sample_rate * hop_ms / 1000))
+        block_frames = hop * max(1, int(block_seconds * 1000 / hop_ms))
+
+        energies = []
+        leftover = np.empty(0, dtype=np.float32)
+        while True:
+            raw = wf.readframes(block_frames)
+            if not raw:
+                break
+            if sample_width == 1:
+                samples = np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0
+            elif sample_width == 2:
+                samples = np.frombuffer(raw, dtype='<i2').astype(np.float32)
+            elif sample_width == 3:
+                b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+                samples = ((b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)) << 8 >> 8).astype(np.float32)
+            elif sample_width == 4:
+                samples = np.frombuffer(raw, dtype='<i4').astype(np.float32)
+            else:
+                raise ValueError(f"Unsupported sample width: {sample_width} bytes")
+
+            samples = np.concatenate((leftover, samples))
+            n_frames = len(samples) // (hop * n_channels)
+            framed = samples[:n_frames * hop * n_channels].reshape(n_frames, hop * n_channels)
+            leftover = samples[n_frames * hop * n_channels:]
+            # Mean power over all channels of the frame
+            energies.append(np.einsum('ij,ij->i', framed, framed) / framed.shape[1])
+
+    energy = np.concatenate(energies) if energies else np.empty(0, dtype=np.float32)
+    energy_db = 10.0 * np.log10(energy + 1e-10)
+    return energy_db, hop / sample_rate
+
+
+def detect_speech_segments(energy_db, hop_s):
+    """
+    Energy-based voice activity detection over framed windows.
+    Returns two arrays (onsets, offsets) in seconds.
+    """
+    if len(energy_db) == 0:
+        return np.empty(0), np.empty(0)
+
+    kernel = np.ones(VAD_SMOOTH_FRAMES) / VAD_SMOOTH_FRAMES
+    smoothed = np.convolve(energy_db, kernel, mode='same')
+
+    # Estimate the noise floor from the quietest frames
+    noise_floor = np.percentile(smoothed, 10)
+    speech = smoothed > noise_floor + VAD_THRESHOLD_DB
+
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    onsets = np.flatnonzero(edges == 1)
+    offsets = np.flatnonzero(edges == -1)
+    if len(onsets) == 0:
+        return np.empty(0), np.empty(0)
+
+    # Merge segments separated by pauses that are too short
+    min_gap = int(VAD_MIN_SILENCE_MS / 1000 / hop_s)
+    keep_gap = (onsets[1:] - offsets[:-1]) >= min_gap
+    onsets = np.concatenate((onsets[:1], onsets[1:][keep_gap]))
+    offsets = np.concatenate((offsets[:-1][keep_gap], offsets[-1:]))
+
+    # Drop bursts that are too short to be speech
+    min_len = int(VAD_MIN_SPEECH_MS / 1000 / hop_s)
+    keep_len = (offsets - onsets) >= min_len
+    return onsets[keep_len] * hop_s, offsets[keep_len] * hop_s
+
+
+def snap_to_nearest(times, boundaries, max_shift=SNAP_MAX_SHIFT_S):
+    """Moves each time to the closest boundary, unless that boundary is further than max_shift."""
+    times = np.asarray(times, dtype=np.float64)
+    if len(boundaries) == 0:
+        return times
+    idx = np.searchsorted(boundaries, times)
+    left = boundaries[np.clip(idx - 1, 0, len(boundaries) - 1)]
+    right = boundaries[np.clip(idx, 0, len(boundaries) - 1)]
+    nearest = np.where(np.abs(times - left) <= np.abs(right - times), left, right)
+    return np.where(np.abs(nearest - times) <= max_shift, nearest, times)
+
+
+def refine_cue_times(cues, audio_path):
+    """
+    Snaps each cue's start to the nearest speech onset and its end to the nearest speech
+    offset in the audio. Cues are (start_seconds, end_seconds, text) tuples.
+    """
+    if not cues:
+        return cues
+    energy_db, hop_s = read_frame_energy(audio_path)
+    onsets, offsets = detect_speech_segments(energy_db, hop_s)
+
+    starts = np.array([c[0] for c in cues], dtype=np.float64)
+    ends = np.array([c[1] for c in cues], dtype=np.float64)
+    new_starts = snap_to_nearest(starts, onsets)
+    new_ends = snap_to_nearest(ends, offsets)
+
+    # Keep the original timing where snapping would produce an empty or inverted cue,
+    # and never let a cue run into the next one.
+    invalid = new_ends <= new_starts
+    new_starts[invalid] = starts[invalid]
+    new_ends[invalid] = ends[invalid]
+    new_ends[:-1] = np.minimum(new_ends[:-1], np.maximum(new_starts[1:], new_starts[:-1] + hop_s))
+
+    return [(float(s), float(e), text) for s, e, (_, _, text) in zip(new_starts, new_ends, cues)]
+
+
+def create_srt_file_flexible(text_data, output_filename="output.srt", audio_path=None):
     """
     Converts a string of timed dialogue into an SRT subtitle file.
     Handles time ranges on their own line, followed by dialogue on subsequent lines.
@@ -10,57 +138,70 @@ def create_srt_file_flexible(text_data, output_filename="output.srt"):
         text_data (str): A string where each line contains either a time range
                          (e.g., "HH:MM - HH:MM") or dialogue text.
         output_filename (str): The name of the SRT file to create.
+        audio_path (str): Optional WAV file of the episode. When given, cue times are
+                          snapped to the nearest speech boundaries in the audio.
     """
     # Regex to match time ranges like '1:21 - 1:23', '01:21 - 01:23', '1:21:00 - 1:23:59'
     # This pattern only needs to capture the start and end time.
     time_range_pattern = re.compile(r'^\s*(\d{1,2}:\d{2}(?::\d{2})?)\s*-\s*(\d{1,2}:\d{2}(?::\d{2})?)\s*$')
 
-    def format_time_srt(time_str):
-        """Formats a time string (e.g., '1:21' or '1:21:00') to 'HH:MM:SS,ms'."""
+    def parse_time_seconds(time_str):
+        """Parses a time string (e.g., '1:21' or '1:21:00') to seconds."""
         parts = [int(p) for p in time_str.split(':')]
         h, m, s = 0, 0, 0
         if len(parts) == 2:
             m, s = parts
         elif len(parts) == 3:
             h, m, s = parts
+        return h * 3600 + m * 60 + s
 
-        return f"{h:02d}:{m:02d}:{s:02d},000"
+    def format_time_srt(seconds):
+        """Formats seconds to 'HH:MM:SS,ms'."""
+        total_ms = int(round(seconds * 1000))
+        h, rem = divmod(total_ms, 3600000)
+        m, rem = divmod(rem, 60000)
+        s, ms = divmod(rem, 1000)
+        return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
 
-    with open(output_filename, 'w', encoding='utf-8') as f:
-        subtitle_number = 1
-        current_dialogue_lines = []
-        current_start_time = None
-        current_end_time = None
+    cues = []
+    current_dialogue_lines = []
+    current_start_time = None
+    current_end_time = None
 
-        def write_current_subtitle():
-            nonlocal subtitle_number
-            if current_dialogue_lines and current_start_time and current_end_time:
-                f.write(f"{subtitle_number}\n")
-                f.write(f"{current_start_time} --> {current_end_time}\n")
-                f.write(f"{' '.join(current_dialogue_lines).strip()}\n\n")
-                subtitle_number += 1
+    def add_current_cue():
+        if current_dialogue_lines and current_start_time is not None and current_end_time is not None:
+            cues.append((current_start_time, current_end_time, ' '.join(current_dialogue_lines).strip()))
 
-        for line in text_data.strip().split('\n'):
-            line = line.strip()
-            if not line:
-                continue
+    for line in text_data.strip().split('\n'):
+        line = line.strip()
+        if not line:
+            continue
 
-            match = time_range_pattern.match(line)
-            if match:
-                # If a new time range is found, write the previous subtitle (if any)
-                write_current_subtitle()
+        match = time_range_pattern.match(line)
+        if match:
+            # If a new time range is found, keep the previous subtitle (if any)
+            add_current_cue()
 
-                # Reset for the new subtitle
-                start_time_raw, end_time_raw = match.groups()
-                current_start_time = format_time_srt(start_time_raw)
-                current_end_time = format_time_srt(end_time_raw)
-                current_dialogue_lines = []  # Start fresh for the new time range
-            else:
-                # If it's a raw string, append it to the current dialogue
-                current_dialogue_lines.append(line)
+            # Reset for the new subtitle
+            start_time_raw, end_time_raw = match.groups()
+            current_start_time = parse_time_seconds(start_time_raw)
+            current_end_time = parse_time_seconds(end_time_raw)
+            current_dialogue_lines = []  # Start fresh for the new time range
+        else:
+            # If it's a raw string, append it to the current dialogue
+            current_dialogue_lines.append(line)
+
+    # Keep any remaining subtitle at the end of the input
+    add_current_cue()
 
-        # Write any remaining subtitle at the end of the file
-        write_current_subtitle()
+    if audio_path:
+        cues = refine_cue_times(cues, audio_path)
+
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        for subtitle_number, (start, end, text) in enumerate(cues, start=1):
+            f.write(f"{subtitle_number}\n")
+            f.write(f"{format_time_srt(start)} --> {format_time_srt(end)}\n")
+            f.write(f"{text}\n\n")
 
 
 # Your input text with dates on separate lines
@@ -1366,5 +1507,5 @@ Hola, Armando ¿cómo te ha ido? Roberto.
 """
 
 # Create the SRT file using the flexible function
-create_srt_file_flexible(input_text)
+create_srt_file_flexible(input_text, audio_path=AUDIO_PATH)
 print("SRT file 'output.srt' created successfully, handling dates on separate lines!")
\ No newline at end of file
@@ -1,40 +1,241 @@
 
 # Script to count characters in a specified field for Anki cards matching a query using AnkiConnect
-# Requires: Anki running with AnkiConnect add-on
+# Requires: Anki running with AnkiConnect add-on (or USE_COLLECTION to read collection.anki2 directly)
+# Streams the cards once and updates totals, histograms and percentiles for every field in FIELD_NAMES,
+# overall and grouped by deck, tag and notetype.
 
-import requests
+import csv
+import io
+import itertools
+import json
+import sys
+from collections import Counter
+
+from anki_collection import Collection, open_collection
+from anki_connect import AnkiConnect
+from anki_mirror import get_mirrored_notes
+from field_text import count_many, make_pool
 
 # --- USER CONFIGURATION ---
 ANKICONNECT_URL = "http://localhost:8765"
 QUERY = "SentenceAudio: tag:Tool::GameSentenceMiner"  # Example: all cards in 'Default' deck
 FIELD_NAME = "Sentence"    # Field to count characters in
+FIELD_NAMES = [FIELD_NAME]  # All fields to aggregate in the same pass, e.g. ["Sentence", "Word"]
+GROUP_BY = ["deck", "tag", "notetype"]  # Any of "deck", "tag", "notetype"; totals over all cards are always shown
+HISTOGRAM_EDGES = [0, 10, 20, 30, 50, 80, 120]  # Bin starts; the last bin is open-ended
+PERCENTILES = [50, 90, 99]
+OUTPUT_FORMAT = "text"     # "text", "json" or "csv"
+OUTPUT_PATH = None         # Write the report to this file instead of stdout
+VERBOSE = False            # Also print one line per card
+# "raw" counts the stored value (HTML, [sound:] tags and furigana included), "text" the visible text,
+# "japanese" only kana and kanji of the visible text, like srt_chars_per_hr.py
+COUNT_MODE = "japanese"
+FURIGANA = "base"          # Count furigana bases ("base", e.g. 漢字) or readings ("reading", e.g. かんじ)
+POOL_PROCESSES = 0         # Count in a process pool of this many workers (0 = in this process)
+BATCH_SIZE = 20000         # Cards counted per batch
+USE_MIRROR = False         # Read from a local SQLite mirror that only syncs notes edited since the last run
+MIRROR_PATH = "anki_mirror.sqlite"
+# Read the collection file directly, without Anki running. Supports tag:, deck:, note: and Field: searches.
+USE_COLLECTION = False
+COLLECTION_PATH = r'C:\Users\Beangate\AppData\Roaming\Anki2\User 1\collection.anki2'
+COLLECTION_SNAPSHOT = False  # Copy the collection into memory first (use while Anki is open)
 # -------------------------
 
-def invoke(action, **params):
-	return requests.post(ANKICONNECT_URL, json={
-		"action": action,
-		"version": 6,
-		"params": params
-	}).json()
+UNKNOWN_DECK = "(deck not mirrored)"
+UNTAGGED = "(untagged)"
+
+class GroupedStats:
+	"""
+	Character-count aggregates for every (dimension, group, field), updated together in one pass.
+	Each aggregate is a Counter of field lengths, which gives exact totals, histograms and percentiles.
+	Cards whose notetype lacks a field are left out of that field's aggregates.
+	"""
+
+	def __init__(self, field_names, group_by):
+		self.field_names = field_names
+		self.group_by = group_by
+		self.lengths = {}
+		self.cards = 0
+
+	def add(self, deck, tags, notetype, lengths):
+		"""Adds one card; lengths holds its character count per field (None if it has no such field)."""
+		self.cards += 1
+		keys = [("all", "all")]
+		if "deck" in self.group_by:
+			keys.append(("deck", deck))
+		if "tag" in self.group_by:
+			keys.extend(("tag", tag) for tag in (tags or [UNTAGGED]))
+		if "notetype" in self.group_by:
+			keys.append(("notetype", notetype))
+		for field, length in zip(self.field_names, lengths):
+			if length is None:
+				continue
+			for dimension, group in keys:
+				counter = self.lengths.get((dimension, group, field))
+				if counter is None:
+					counter = self.lengths[(dimension, group, field)] = Counter()
+				counter[length] += 1
+
+	def total(self, field):
+		counter = self.lengths.get(("all", "all", field), Counter())
+		return sum(length * n for length, n in counter.items())
+
+	def summaries(self):
+		"""Yields (dimension, group, field, summary dict), overall first, then each dimension by group."""
+		order = {dimension: i for i, dimension in enumerate(["all"] + self.group_by)}
+		field_order = {field: i for i, field in enumerate(self.field_names)}
+		for (dimension, group, field) in sorted(self.lengths, key=lambda k: (order[k[0]], str(k[1]), field_order[k[2]])):
+			yield dimension, group, field, summarize(self.lengths[(dimension, group, field)])
+
+def summarize(counter):
+	"""Count, total, mean, min, max, nearest-rank percentiles and histogram of a Counter of lengths."""
+	lengths = sorted(counter)
+	count = sum(counter.values())
+	total = sum(length * n for length, n in counter.items())
+	percentiles = {}
+	seen = 0
+	targets = sorted(PERCENTILES)
+	for length in lengths:
+		seen += counter[length]
+		while targets and seen >= targets[0] / 100 * count:
+			percentiles[f"p{targets.pop(0)}"] = length
+	histogram = []
+	for i, start in enumerate(HISTOGRAM_EDGES):
+		end = HISTOGRAM_EDGES[i + 1] if i + 1 < len(HISTOGRAM_EDGES) else None
+		n = sum(c for length, c in counter.items() if length >= start and (end is None or length < end))
+		histogram.append({"from": start, "to": end, "count": n})
+	return {
+		"count": count,
+		"total": total,
+		"mean": round(total / count, 2) if count else 0,
+		"min": lengths[0] if lengths else 0,
+		"max": lengths[-1] if lengths else 0,
+		"percentiles": percentiles,
+		"histogram": histogram,
+	}
+
+def iter_collection_cards():
+	"""Yields (label, deck, tags, notetype, field values) per card from collection.anki2."""
+	conn = open_collection(COLLECTION_PATH, snapshot=COLLECTION_SNAPSHOT)
+	try:
+		col = Collection(conn)
+		decks, notetypes = col.decks(), col.notetypes()
+		for card_id, _, deck_id, notetype_id, tags, values in col.iter_cards(QUERY, FIELD_NAMES):
+			yield (f"Card ID {card_id}", decks.get(deck_id, str(deck_id)), tags.split(),
+				   notetypes.get(notetype_id, (str(notetype_id),))[0], values)
+	finally:
+		conn.close()
+
+def note_values(note):
+	fields = note.get("fields", {})
+	return tuple(fields[name]["value"] if name in fields else None for name in FIELD_NAMES)
+
+def iter_mirror_notes():
+	"""Yields one record per mirrored note; the mirror stores notes, not cards or decks."""
+	for note in get_mirrored_notes(QUERY, MIRROR_PATH, ANKICONNECT_URL):
+		yield f"Note ID {note['noteId']}", UNKNOWN_DECK, note["tags"], note["modelName"], note_values(note)
+
+def iter_anki_connect_cards():
+	"""
+	Yields one record per matching card. Notes are fetched once with notesInfo (which has the tags
+	cardsInfo lacks) and decks come from a single getDecks call, so nothing is downloaded twice.
+	"""
+	with AnkiConnect(ANKICONNECT_URL) as anki:
+		card_ids = anki.invoke("findCards", query=QUERY)
+		if not card_ids:
+			return
+		batch = anki.batch()
+		batch.add("getDecks", cards=card_ids)
+		batch.add("cardsToNotes", cards=card_ids)
+		found = batch.send()
+		deck_of_card = {cid: deck for deck, cids in found["getDecks"].items() for cid in cids}
+		wanted = set(card_ids)
+		for note in anki.iter_chunked("notesInfo", "notes", list(dict.fromkeys(found["cardsToNotes"]))):
+			if not note:
+				continue
+			values = note_values(note)
+			for card_id in note.get("cards", []):
+				if card_id in wanted:
+					yield (f"Card ID {card_id}", deck_of_card.get(card_id, UNKNOWN_DECK), note["tags"],
+						   note["modelName"], values)
+
+def format_report(stats):
+	if OUTPUT_FORMAT == "json":
+		report = {"query": QUERY, "cards": stats.cards, "groups": {}}
+		for dimension, group, field, summary in stats.summaries():
+			report["groups"].setdefault(dimension, {}).setdefault(group, {})[field] = summary
+		return json.dumps(report, ensure_ascii=False, indent=2)
+
+	if OUTPUT_FORMAT == "csv":
+		out = io.StringIO()
+		writer = csv.writer(out)
+		bins = [f"{start}-{'' if i + 1 == len(HISTOGRAM_EDGES) else HISTOGRAM_EDGES[i + 1] - 1}"
+				for i, start in enumerate(HISTOGRAM_EDGES)]
+		writer.writerow(["dimension", "group", "field", "count", "total", "mean", "min", "max"]
+						+ [f"p{p}" for p in sorted(PERCENTILES)] + [f"hist_{b}" for b in bins])
+		for dimension, group, field, s in stats.summaries():
+			writer.writerow([dimension, group, field, s["count"], s["total"], s["mean"], s["min"], s["max"]]
+							+ [s["percentiles"].get(f"p{p}") for p in sorted(PERCENTILES)]
+							+ [h["count"] for h in s["histogram"]])
+		return out.getvalue()
+
+	lines = []
+	current = None
+	for dimension, group, field, s in stats.summaries():
+		if dimension != current:
+			current = dimension
+			lines.append(f"\n== {'All cards' if dimension == 'all' else 'By ' + dimension} ==")
+		percentiles = "  ".join(f"{name} {value}" for name, value in s["percentiles"].items())
+		label = field if dimension == "all" else f"{group} [{field}]"
+		lines.append(f"{label}: {s['count']} cards, {s['total']:,} chars, mean {s['mean']}, "
+					 f"min {s['min']}, max {s['max']}  {percentiles}")
+		if dimension == "all":
+			for h in s["histogram"]:
+				span = f"{h['from']}+" if h["to"] is None else f"{h['from']}-{h['to'] - 1}"
+				lines.append(f"  {span:>8}: {h['count']}")
+	lines.append("")
+	for field in stats.field_names:
+		lines.append(f"Total characters in field '{field}' ({COUNT_MODE}): {stats.total(field)}")
+	return "\n".join(lines)
 
 def main():
-	# Find card IDs matching the query
-	resp = invoke("findCards", query=QUERY)
-	card_ids = resp.get("result", [])
-	if not card_ids:
+	if USE_COLLECTION:
+		records = iter_collection_cards()
+	elif USE_MIRROR:
+		# The mirror stores notes, so counts are per note rather than per card
+		records = iter_mirror_notes()
+	else:
+		records = iter_anki_connect_cards()
+
+	stats = GroupedStats(FIELD_NAMES, GROUP_BY)
+	pool = make_pool(POOL_PROCESSES) if POOL_PROCESSES else None
+	try:
+		while True:
+			batch = list(itertools.islice(records, BATCH_SIZE))
+			if not batch:
+				break
+			present = [value for *_, values in batch for value in values if value is not None]
+			counts = iter(count_many(present, COUNT_MODE, FURIGANA, executor=pool))
+			for label, deck, tags, notetype, values in batch:
+				lengths = tuple(None if value is None else next(counts) for value in values)
+				stats.add(deck, tags, notetype, lengths)
+				if VERBOSE:
+					print(f"{label}: " + "; ".join(f"{length or 0} characters in '{field}'"
+												   for field, length in zip(FIELD_NAMES, lengths)))
+	finally:
+		if pool:
+			pool.shutdown()
+	if not stats.cards:
 		print("No cards found for query.")
 		return
-	# Get card info
-	info = invoke("cardsInfo", cards=card_ids)
-	cards = info.get("result", [])
-	total_chars = 0
-	for card in cards:
-		fields = card.get("fields", {})
-		field_value = fields.get(FIELD_NAME, {}).get("value", "")
-		char_count = len(str(field_value))
-		print(f"Card ID {card['cardId']}: {char_count} characters in '{FIELD_NAME}'")
-		total_chars += char_count
-	print(f"\nTotal characters in field '{FIELD_NAME}': {total_chars}")
+
+	report = format_report(stats)
+	if OUTPUT_PATH:
+		with open(OUTPUT_PATH, "w", encoding="utf-8", newline="") as f:
+			f.write(report)
+		print(f"Wrote {OUTPUT_FORMAT} report for {stats.cards} cards to {OUTPUT_PATH}")
+	else:
+		sys.stdout.write(report + "\n")
 
 if __name__ == "__main__":
 	main()